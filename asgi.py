@@ -1,4 +1,5 @@
 from channels.asgi import get_channel_layer
+from main.admission import admission_control
 
 
-channel_layer = get_channel_layer()
+channel_layer = admission_control(get_channel_layer())
@@ -0,0 +1,59 @@
+""" Time fabfile config resolution against the loop it replaced.
+
+Run with `python bench_fabfile.py`. Each case resolves the dev and prod
+configs of a project the way `subs` does for every command.
+"""
+import argparse
+import timeit
+from string import Template
+
+import fabfile
+
+
+def merge_cfgs_loop(*args):
+    """ The previous `merge_cfgs`: substitute every value until none change.
+    """
+    x = {}
+    for a in args:
+        x.update(a)
+    while 1:
+        done = True
+        y = {}
+        for k, v in x.items():
+            y[k] = Template(v).safe_substitute(x)
+            if y[k] != v:
+                done = False
+        x = y
+        if done:
+            break
+    return x
+
+
+def resolve(merge, extra):
+    for config in (fabfile.DEV_CONFIG, fabfile.PROD_CONFIG):
+        cfg = merge(fabfile.BASE_CONFIG, config, extra)
+        defaults = {'service': fabfile.DEFAULT_SERVICE[cfg['layout']]}
+        merge(cfg, defaults)
+
+
+def cold(*args):
+    fabfile._resolve_cfg.cache_clear()
+    return fabfile.merge_cfgs(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+    extra = {'project': 'demo', 'aws_profile': 'demo', 'platform': 'aws'}
+    for name, merge in (('loop', merge_cfgs_loop),
+                        ('resolver', cold),
+                        ('memoized', fabfile.merge_cfgs)):
+        elapsed = timeit.timeit(lambda: resolve(merge, extra), number=args.number)
+        print('{:>10}: {:.1f}us per dev and prod resolution'.format(
+            name, elapsed / args.number * 1e6
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,8 @@
 import sys
 import os
 import stat
+import base64
+import hashlib
 import shutil
 import tempfile
 import datetime
@@ -20,6 +22,13 @@ import json
 import shlex
 import random
 import string
+import functools
+import subprocess
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from string import Template
 
 from fabric.api import run, task, local, shell_env, warn_only, hide, env
@@ -65,21 +74,66 @@ PROD_CONFIG = {
 }
 
 
+class ConfigCycleError(ValueError):
+    pass
+
+
+class ConfigResolver(object):
+    """ Mapping that expands config values on first access.
+
+    Each value is substituted until it stops changing, looking up the
+    keys it references (expanded in turn) as it goes, so every key is
+    expanded once, in dependency order. As with substituting every
+    value until none change, `$$` becomes `$` on each pass and the
+    `$name` it leaves behind is expanded too. Values that refer back
+    to themselves, directly or not, raise `ConfigCycleError`.
+    """
+    def __init__(self, raw):
+        self.raw = raw
+        self.resolved = {}
+        self.active = []
+
+    def __getitem__(self, key):
+        if key in self.resolved:
+            return self.resolved[key]
+        if key not in self.raw:
+            raise KeyError(key)
+        if key in self.active:
+            cycle = self.active[self.active.index(key):] + [key]
+            raise ConfigCycleError(
+                'Config values refer to each other: {}'.format(' -> '.join(cycle))
+            )
+        self.active.append(key)
+        try:
+            value = self.raw[key]
+            while True:
+                expanded = Template(value).safe_substitute(self)
+                if expanded == value:
+                    break
+                value = expanded
+        finally:
+            self.active.pop()
+        self.resolved[key] = value
+        return value
+
+
+@functools.lru_cache(maxsize=256)
+def _resolve_cfg(items):
+    resolver = ConfigResolver(dict(items))
+    return tuple((k, resolver[k]) for k, _ in items)
+
+
 def merge_cfgs(*args):
     x = {}
     for a in args:
         x.update(a)
-    while 1:
-        done = True
-        y = {}
-        for k, v in x.items():
-            y[k] = Template(v).safe_substitute(x)
-            if y[k] != v:
-                done = False
-        x = y
-        if done:
-            break
-    return x
+    try:
+        items = tuple(sorted(x.items()))
+        hash(items)
+    except TypeError:
+        resolver = ConfigResolver(x)
+        return {k: resolver[k] for k in x}
+    return dict(_resolve_cfg(items))
 
 
 def dev_cfg(*args):
@@ -137,6 +191,24 @@ def gen_secret(length=64):
     return ''.join(random.SystemRandom().choice(string.ascii_uppercase + string.digits) for _ in range(length))
 
 
+@contextmanager
+def phase(name, timings=None):
+    """ Time a step of a longer task, printing how long it took.
+    """
+    start = time.time()
+    yield
+    elapsed = time.time() - start
+    print('*** {}: {:.1f}s'.format(name, elapsed))
+    if timings is not None:
+        timings[name] = elapsed
+
+
+def print_timings(timings):
+    for name, elapsed in timings.items():
+        print('{:>12}: {:.1f}s'.format(name, elapsed))
+    print('{:>12}: {:.1f}s'.format('total', sum(timings.values())))
+
+
 def get_db_name():
     run_cfg('$compose up -d db')
     res = run_cfg('$compose ps | grep db | awk \'{{print $$1}}\' | head -n1',
@@ -337,12 +409,19 @@ def setup_bucket():
 
 
 @task(alias='cs')
-def collect_static():
+def collect_static(full=False, delete_stale=False):
     """ Collect static files (usually to S3).
+
+    Only changed files are uploaded, unless `full` is set.
     """
+    cmd = '$manage collectstatic'
+    if not full:
+        cmd += ' --noinput --incremental'
+        if delete_stale:
+            cmd += ' --delete-stale'
     env = aws_profile()
     with shell_env(**env):
-        run_cfg('$manage collectstatic', False, service='web')
+        run_cfg(cmd, False, service='web')
 
 
 @task
@@ -367,17 +446,22 @@ def heroku_download_db(filename=None):
         filename = 'db-{}.dump'.format(now.strftime('%Y%m%d%H%M'))
     dst = os.path.join('var', filename)
     heroku_run('pg:backups capture -a $app')
-    run_cfg('curl -so %s $$(heroku pg:backups -a $app public-url)' % dst)
+    url = run_cfg('heroku pg:backups -a $app public-url', dev=False, capture=True)
+    download_url(url.strip(), dst)
     return filename
 
 
 @task
-def load_db(filename):
+def load_db(filename, jobs=4):
+    """ Restore a dump from var/, using `jobs` parallel workers.
+
+    Works with both custom format files and directory format dumps.
+    """
     src = os.path.join('/share', filename)
     db_name = get_db_name()
     cmd = (
-        'pg_restore --verbose --clean --no-acl --no-owner'
-        ' -h 0.0.0.0 -U postgres -d postgres {}'.format(src)
+        'pg_restore --verbose --clean --no-acl --no-owner -j {}'
+        ' -h 0.0.0.0 -U postgres -d postgres {}'.format(int(jobs), src)
     )
     fullcmd = 'docker exec {container_name} sh -c "{cmd}"'.format(
         container_name=db_name, cmd=cmd
@@ -388,9 +472,13 @@ def load_db(filename):
 
 
 @task
-def pull_db():
-    fn = heroku_download_db()
-    load_db(fn)
+def pull_db(jobs=4):
+    timings = {}
+    with phase('download', timings):
+        fn = heroku_download_db()
+    with phase('restore', timings):
+        load_db(fn, jobs)
+    print_timings(timings)
 
 
 @task
@@ -406,10 +494,21 @@ def psql():
 
 
 @task
-def dump_db(filename):
+def dump_db(filename, jobs=1):
+    """ Dump the database to var/.
+
+    With more than one job the dump is a directory, written by `jobs`
+    parallel workers.
+    """
+    jobs = int(jobs)
     db_name = get_db_name()
-    cmd = ('pg_dump -Fc --no-acl --no-owner -h 0.0.0.0 -U postgres postgres > '
-           '/share/{filename}').format(filename=filename)
+    if jobs > 1:
+        cmd = ('rm -rf /share/{filename} && pg_dump -Fd -j {jobs} --no-acl'
+               ' --no-owner -h 0.0.0.0 -U postgres -f /share/{filename}'
+               ' postgres').format(filename=filename, jobs=jobs)
+    else:
+        cmd = ('pg_dump -Fc --no-acl --no-owner -h 0.0.0.0 -U postgres postgres > '
+               '/share/{filename}').format(filename=filename)
     fullcmd = 'docker exec {container_name} sh -c "{cmd}"'.format(
         container_name=db_name, cmd=cmd
     )
@@ -417,45 +516,361 @@ def dump_db(filename):
     run_cfg('$compose stop db')
 
 
+def stream_dump_db():
+    """ Start a custom format dump, returning the process writing it.
+    """
+    db_name = get_db_name()
+    cmd = 'pg_dump -Fc --no-acl --no-owner -h 0.0.0.0 -U postgres postgres'
+    return subprocess.Popen(
+        ['docker', 'exec', db_name, 'sh', '-c', cmd], stdout=subprocess.PIPE
+    )
+
+
+# S3 and download transfers. Set S3_ENDPOINT_URL to point these at a
+# local stand-in such as minio or moto's server (see `aws_client`).
+
+TRANSFER_PART_SIZE = 16 * 1024 * 1024
+
+TRANSFER_CONCURRENCY = 8
+
+
+def s3_client():
+    return aws_client('s3')
+
+
+def retry(func, *args, retries=3, **kwargs):
+    for attempt in range(retries):
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            if attempt == retries - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+
+class Progress(object):
+    """ Thread safe transfer progress, printed on one line.
+    """
+    def __init__(self, name, total=None):
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.start = time.time()
+        self._lock = threading.Lock()
+
+    def __call__(self, size):
+        with self._lock:
+            self.done += size
+            self.show()
+
+    def show(self, end=''):
+        elapsed = max(time.time() - self.start, 1e-6)
+        mb = self.done / 1024 / 1024
+        total = ' of {:.1f}'.format(self.total / 1024 / 1024) if self.total else ''
+        sys.stdout.write('\r{}: {:.1f}{} MB, {:.1f} MB/s{}'.format(
+            self.name, mb, total, mb / elapsed, end
+        ))
+        sys.stdout.flush()
+
+    def finish(self):
+        self.show('\n')
+
+
+def multipart_etag(digests):
+    """ The ETag S3 gives an object uploaded in parts with these md5s.
+    """
+    md5 = hashlib.md5(b''.join(digests)).hexdigest()
+    return '"{}-{}"'.format(md5, len(digests))
+
+
 @task
-def upload_s3(filename, bucket_name, remote_key):
-    env = aws_profile(boto=True)
-    s3 = boto3.client('s3', **env)
-    s3.upload_file(filename, bucket_name, remote_key)
-    url = s3.generate_presigned_url('get_object', Params={
+def upload_s3(filename, bucket_name, remote_key, part_size=TRANSFER_PART_SIZE,
+              concurrency=TRANSFER_CONCURRENCY):
+    """ Upload a file to S3 in concurrent parts.
+
+    Each part is checked by S3 against its md5, and the whole object
+    against the ETag the parts add up to. An interrupted upload is
+    resumed by running the task again: parts already uploaded with the
+    right md5 are kept.
+    """
+    part_size, concurrency = int(part_size), int(concurrency)
+    s3 = s3_client()
+    size = os.path.getsize(filename)
+    count = max((size + part_size - 1) // part_size, 1)
+    state_path = filename + '.upload'
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as file:
+            state = json.load(file)
+
+    def start():
+        state = {
+            'key': [bucket_name, remote_key, size, part_size],
+            'upload_id': s3.create_multipart_upload(
+                Bucket=bucket_name, Key=remote_key
+            )['UploadId'],
+        }
+        with open(state_path, 'w') as file:
+            json.dump(state, file)
+        return state
+
+    if state.get('key') != [bucket_name, remote_key, size, part_size]:
+        state = start()
+    upload_id = state['upload_id']
+
+    uploaded = {}
+    try:
+        for page in s3.get_paginator('list_parts').paginate(
+                Bucket=bucket_name, Key=remote_key, UploadId=upload_id):
+            for part in page.get('Parts', []):
+                uploaded[part['PartNumber']] = part['ETag']
+    except s3.exceptions.NoSuchUpload:
+        # Aborted, or expired by a lifecycle rule; start again.
+        uploaded = {}
+        upload_id = start()['upload_id']
+
+    progress = Progress(remote_key, size)
+
+    def upload_part(number):
+        with open(filename, 'rb') as file:
+            file.seek((number - 1) * part_size)
+            data = file.read(part_size)
+        digest = hashlib.md5(data).digest()
+        if uploaded.get(number) != '"{}"'.format(binascii.hexlify(digest).decode()):
+            retry(
+                s3.upload_part, Bucket=bucket_name, Key=remote_key,
+                UploadId=upload_id, PartNumber=number, Body=data,
+                ContentMD5=base64.b64encode(digest).decode()
+            )
+        progress(len(data))
+        return digest
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        digests = list(pool.map(upload_part, range(1, count + 1)))
+    progress.finish()
+    s3.complete_multipart_upload(
+        Bucket=bucket_name, Key=remote_key, UploadId=upload_id,
+        MultipartUpload={'Parts': [
+            {'PartNumber': n, 'ETag': '"{}"'.format(binascii.hexlify(d).decode())}
+            for n, d in enumerate(digests, 1)
+        ]}
+    )
+    os.remove(state_path)
+    etag = s3.head_object(Bucket=bucket_name, Key=remote_key)['ETag']
+    if etag != multipart_etag(digests):
+        sys.exit('Upload of {} failed verification.'.format(filename))
+    return s3.generate_presigned_url('get_object', Params={
         'Bucket': bucket_name, 'Key': remote_key
     })
-    return url
+
+
+def stream_s3(stream, bucket_name, remote_key, part_size=64 * 1024 * 1024,
+              concurrency=4, check=None):
+    """ Upload a stream to S3 in parts, without writing it to disk.
+
+    Parts are uploaded by `concurrency` threads while the next ones are
+    read, and each is retried. Once the stream ends `check` is called,
+    if given, and can raise to stop a bad upload being completed. The
+    upload is aborted if it can't be completed, so no orphaned parts
+    are left behind.
+    """
+    s3 = s3_client()
+    upload_id = s3.create_multipart_upload(
+        Bucket=bucket_name, Key=remote_key
+    )['UploadId']
+    progress = Progress(remote_key)
+
+    def upload_part(number, data):
+        digest = hashlib.md5(data).digest()
+        res = retry(
+            s3.upload_part, Bucket=bucket_name, Key=remote_key,
+            UploadId=upload_id, PartNumber=number, Body=data,
+            ContentMD5=base64.b64encode(digest).decode()
+        )
+        progress(len(data))
+        return {'PartNumber': number, 'ETag': res['ETag']}
+
+    # Hold at most `concurrency` parts in memory at once.
+    slots = threading.BoundedSemaphore(concurrency)
+    try:
+        with ThreadPoolExecutor(concurrency) as pool:
+            futures = []
+            while True:
+                data = stream.read(part_size)
+                if not data:
+                    break
+                slots.acquire()
+                for future in futures:
+                    if future.done() and future.exception():
+                        raise future.exception()
+                future = pool.submit(upload_part, len(futures) + 1, data)
+                future.add_done_callback(lambda f: slots.release())
+                futures.append(future)
+            parts = [f.result() for f in futures]
+        progress.finish()
+        if check is not None:
+            check()
+        s3.complete_multipart_upload(
+            Bucket=bucket_name, Key=remote_key, UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+    except:
+        s3.abort_multipart_upload(
+            Bucket=bucket_name, Key=remote_key, UploadId=upload_id
+        )
+        raise
+    return s3.generate_presigned_url('get_object', Params={
+        'Bucket': bucket_name, 'Key': remote_key
+    })
+
+
+def check_md5(path, etag):
+    """ Exit unless the file at `path` matches a plain md5 ETag.
+
+    Multipart ETags can't be checked without the part size, so they
+    are let through.
+    """
+    if not etag or '-' in etag:
+        return
+    md5 = hashlib.md5()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            md5.update(chunk)
+    if md5.hexdigest() != etag:
+        sys.exit('Download of {} failed verification.'.format(path))
+
+
+def download_url(url, dst, part_size=TRANSFER_PART_SIZE,
+                 concurrency=TRANSFER_CONCURRENCY):
+    """ Download a URL with concurrent ranged requests.
+
+    Finished ranges are recorded next to the file, so an interrupted
+    download is resumed by running it again. Servers that ignore
+    `Range` are read in a single stream instead. When the server's ETag
+    is a plain md5, as S3's is for objects uploaded in one piece, the
+    file is checked against it.
+    """
+    request = urllib.request.Request(url, headers={'Range': 'bytes=0-0'})
+    with urllib.request.urlopen(request) as res:
+        etag = res.headers.get('ETag', '').strip('"')
+        if res.status != 206:
+            length = res.headers.get('Content-Length')
+            progress = Progress(os.path.basename(dst), length and int(length))
+            with open(dst, 'wb') as file:
+                for chunk in iter(lambda: res.read(1024 * 1024), b''):
+                    file.write(chunk)
+                    progress(len(chunk))
+            progress.finish()
+            check_md5(dst, etag)
+            return
+        size = int(res.headers['Content-Range'].rpartition('/')[2])
+    count = max((size + part_size - 1) // part_size, 1)
+    state_path = dst + '.download'
+    done = set()
+    if os.path.exists(state_path) and os.path.exists(dst):
+        with open(state_path) as file:
+            state = json.load(file)
+        if state['etag'] == etag and state['size'] == size:
+            done = set(state['done'])
+    if not done:
+        with open(dst, 'wb') as file:
+            file.truncate(size)
+    state_lock = threading.Lock()
+    progress = Progress(os.path.basename(dst), size)
+    progress.done = sum(
+        min(part_size, size - i * part_size) for i in done
+    )
+
+    def download_part(index):
+        if index in done:
+            return
+        start = index * part_size
+        end = min(start + part_size, size) - 1
+        request = urllib.request.Request(
+            url, headers={'Range': 'bytes={}-{}'.format(start, end)}
+        )
+
+        def fetch():
+            with urllib.request.urlopen(request) as res:
+                return res.read()
+        data = retry(fetch)
+        if len(data) != end - start + 1:
+            raise IOError('Short read for bytes {}-{}'.format(start, end))
+        with open(dst, 'r+b') as file:
+            file.seek(start)
+            file.write(data)
+        with state_lock:
+            done.add(index)
+            with open(state_path, 'w') as file:
+                json.dump({'etag': etag, 'size': size, 'done': list(done)}, file)
+        progress(len(data))
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(download_part, range(count)))
+    progress.finish()
+    check_md5(dst, etag)
+    os.remove(state_path)
 
 
 @task
 def heroku_deploy_db(bucket_name):
+    """ Copy the local database to Heroku.
+
+    The dump is streamed straight to S3 as it's written, then Heroku
+    restores it from there.
+    """
     now = datetime.datetime.now()
-    filename = 'db-{}.dump'.format(now.strftime('%Y%m%d%H%M'))
-    dump_db(filename)
-    remote_key = 'imports/{}.dump'.format(now.strftime('%Y%m%d%h%i'))
-    filename = 'var/{}'.format(filename)
-    s3path = upload_s3(filename, bucket_name, remote_key)
-    heroku_run('pg:backups -a $app restore "{filename}" DATABASE_URL'.format(
-        filename=s3path,
-    ))
+    remote_key = 'imports/db-{}.dump'.format(now.strftime('%Y%m%d%H%M'))
+    timings = {}
+    with phase('dump+upload', timings):
+        proc = stream_dump_db()
+
+        def check_dump():
+            if proc.wait():
+                raise RuntimeError(
+                    'pg_dump failed with status {}'.format(proc.returncode)
+                )
+
+        try:
+            s3path = stream_s3(
+                proc.stdout, bucket_name, remote_key, check=check_dump
+            )
+        finally:
+            proc.stdout.close()
+            proc.wait()
+        run_cfg('$compose stop db')
+    with phase('restore', timings):
+        heroku_run('pg:backups -a $app restore "{filename}" DATABASE_URL'.format(
+            filename=s3path,
+        ))
+    print_timings(timings)
 
 
 @task
-def aws_deploy_db(filename):
+def aws_deploy_db(filename=None, jobs=4):
+    """ Restore a dump, or a fresh one, to the RDS database.
+
+    Dumping and restoring both use `jobs` parallel workers.
+    """
+    timings = {}
     if filename is None:
         now = datetime.datetime.now()
-        filename = 'var/db-{}.dump'.format(now.strftime('%Y%m%d%H%M'))
-        dump_db(filename)
+        filename = 'db-{}'.format(now.strftime('%Y%m%d%H%M'))
+        with phase('dump', timings):
+            dump_db(filename, jobs)
+        filename = os.path.join('var', filename)
+        print('*** To restore this dump again, pass filename={}'.format(filename))
     endpoint = aws_get_db_endpoint()
-    with shell_env(PGPASSFILE='pgpass'):
-        with warn_only():
-            run_cfg(
-                'pg_restore --verbose --clean --no-acl --no-owner'
-                ' -w -h {} -U $project -d $project {}'.format(
-                    endpoint['Address'], filename
+    with phase('restore', timings):
+        with shell_env(PGPASSFILE='pgpass'):
+            with warn_only():
+                run_cfg(
+                    'pg_restore --verbose --clean --no-acl --no-owner -j {}'
+                    ' -w -h {} -U $project -d $project {}'.format(
+                        int(jobs), endpoint['Address'], filename
+                    )
                 )
-            )
+    print_timings(timings)
 
 
 @task
@@ -770,6 +1185,7 @@ def aws_create_server():
     ), dev=False)
     aws_tag_instance(inst_id, project='$project', layout='$layout')
     aws_allocate_address(inst_id)
+    aws_clear_cache()
 
 
 @task
@@ -806,20 +1222,103 @@ def aws_push(ctr, repo):
     run_cfg('docker push {}:latest'.format(uri), dev=False)
 
 
+# AWS discovery. Lookups go through one shared boto3 session rather
+# than a CLI process each, and their results are kept on disk for
+# AWS_CACHE_SECONDS so repeated tasks skip the API altogether.
+
+AWS_CACHE_FILE = os.path.join('var', '.aws-cache.json')
+
+AWS_CACHE_SECONDS = 300
+
+_aws_session = None
+_aws_clients = {}
+_aws_lock = threading.Lock()
+_aws_cache_lock = threading.Lock()
+
+
+def aws_client(service):
+    """ A client from the shared session.
+
+    Sessions aren't thread safe but clients are, so clients are made
+    once, under a lock, and then shared. `<SERVICE>_ENDPOINT_URL`, such
+    as `S3_ENDPOINT_URL`, points a service at a local stand-in.
+    """
+    global _aws_session
+    with _aws_lock:
+        if _aws_session is None:
+            cfg = prod_cfg()
+            _aws_session = boto3.session.Session(
+                profile_name=cfg.get('aws_profile') or None,
+                region_name=cfg['aws_region']
+            )
+        if service not in _aws_clients:
+            endpoint = os.environ.get('{}_ENDPOINT_URL'.format(service.upper()))
+            _aws_clients[service] = _aws_session.client(
+                service, endpoint_url=endpoint or None
+            )
+        return _aws_clients[service]
+
+
+def read_aws_cache():
+    try:
+        with open(AWS_CACHE_FILE) as file:
+            return json.load(file)
+    except (IOError, ValueError):
+        return {}
+
+
+def aws_cached(key, func, fresh=False):
+    """ Return `func()`, or its result from the last few minutes.
+    """
+    cfg = prod_cfg()
+    key = '{}:{}:{}'.format(cfg.get('aws_profile', ''), cfg['aws_region'], key)
+    entry = read_aws_cache().get(key)
+    if not fresh and entry and time.time() - entry[0] < AWS_CACHE_SECONDS:
+        return entry[1]
+    value = func()
+    if value:
+        with _aws_cache_lock:
+            cache = read_aws_cache()
+            cache[key] = [time.time(), value]
+            os.makedirs(os.path.dirname(AWS_CACHE_FILE), exist_ok=True)
+            tmp = AWS_CACHE_FILE + '.tmp'
+            with open(tmp, 'w') as file:
+                json.dump(cache, file)
+            os.replace(tmp, AWS_CACHE_FILE)
+    return value
+
+
+@task
+def aws_clear_cache():
+    if os.path.exists(AWS_CACHE_FILE):
+        os.remove(AWS_CACHE_FILE)
+
+
+def aws_map(func, items, size=100):
+    """ Call `func` concurrently on batches of `size` items.
+
+    Most describe calls take at most a hundred identifiers at once.
+    """
+    batches = [items[i:i + size] for i in range(0, len(items), size)]
+    with ThreadPoolExecutor(8) as pool:
+        return [r for batch in pool.map(func, batches) for r in batch]
+
+
 @task
 def aws_list_tasks():
-    tasks = run_cfg('$aws ecs list-tasks --cluster $project', capture=True,
-                    dev=False)
-    return json.loads(tasks)['taskArns']
+    cluster = subs('$project', dev=False)
+    pages = aws_client('ecs').get_paginator('list_tasks').paginate(cluster=cluster)
+    return [arn for page in pages for arn in page['taskArns']]
 
 
 @task
 def aws_describe_tasks():
-    tasks = ' '.join(['"%s"' % t for t in aws_list_tasks()])
-    tasks = run_cfg('$aws ecs describe-tasks --cluster $project'
-                    ' --tasks {}'.format(tasks), capture=True,
-                    dev=False)
-    return json.loads(tasks)
+    cluster = subs('$project', dev=False)
+    ecs = aws_client('ecs')
+    return {'tasks': aws_map(
+        lambda arns: ecs.describe_tasks(cluster=cluster, tasks=arns)['tasks'],
+        aws_list_tasks()
+    )}
 
 
 # @task
@@ -831,24 +1330,28 @@ def aws_describe_tasks():
 
 @task
 def aws_describe_containers(arns):
-    arns = ' '.join(['"%s"' % t for t in arns])
-    ctrs = run_cfg('$aws ecs describe-container-instances --cluster $project'
-                   ' --container-instances {}'.format(arns), capture=True,
-                   dev=False)
-    return json.loads(ctrs)
+    cluster = subs('$project', dev=False)
+    ecs = aws_client('ecs')
+    return {'containerInstances': aws_map(
+        lambda arns: ecs.describe_container_instances(
+            cluster=cluster, containerInstances=arns
+        )['containerInstances'],
+        list(arns)
+    )}
 
 
 @task
 def aws_describe_instances(ids):
-    ids = ' '.join(['"%s"' % i for i in ids])
-    insts = run_cfg('$aws ec2 describe-instances --instance-ids {}'.format(ids),
-                    capture=True, dev=False)
-    return json.loads(insts)
+    ec2 = aws_client('ec2')
+    return {'Reservations': aws_map(
+        lambda ids: ec2.describe_instances(InstanceIds=ids)['Reservations'],
+        list(ids)
+    )}
 
 
 @task
-def aws_public_dns(family):
-    with hide('running'):
+def aws_public_dns(family, fresh=False):
+    def lookup():
         tasks = aws_describe_tasks()
         if family:
             prog = re.compile(r'^.*:task-definition/{}:\d+'.format(family))
@@ -865,7 +1368,8 @@ def aws_public_dns(family):
         for res in insts['Reservations']:
             for ins in res['Instances']:
                 dns.append(ins['PublicDnsName'])
-    return dns
+        return dns
+    return aws_cached('public_dns:{}'.format(family or ''), lookup, fresh)
 
 
 @task
@@ -877,14 +1381,13 @@ def aws_scp(family, src, dst):
 
 
 @task
-def aws_get_db_endpoint():
-    cmd = (
-        '$aws rds describe-db-instances'
-        ' --db-instance-identifier $project'
-    )
-    res = json.loads(run_cfg(cmd, capture=True))
-    endpoint = res['DBInstances'][0]['Endpoint']
-    return endpoint
+def aws_get_db_endpoint(name=None, fresh=False):
+    name = subs('$project' if name is None else name, dev=False)
+
+    def lookup():
+        res = aws_client('rds').describe_db_instances(DBInstanceIdentifier=name)
+        return res['DBInstances'][0]['Endpoint']
+    return aws_cached('db_endpoint:{}'.format(name), lookup, fresh)
 
 
 @task
@@ -895,11 +1398,54 @@ def aws_get_db_password():
     return pw
 
 
+def aws_enable_db_backups(retention=1):
+    """ Turn on automatic backups of the project database.
+
+    RDS only creates read replicas of databases with backups enabled.
+    Waits for the change to apply, which includes a first backup.
+    """
+    name = subs('$project', dev=False)
+    rds = aws_client('rds')
+    instance = rds.describe_db_instances(DBInstanceIdentifier=name)['DBInstances'][0]
+    if instance['BackupRetentionPeriod'] >= retention:
+        return
+    run_cfg('$aws rds modify-db-instance --db-instance-identifier $project'
+            ' --backup-retention-period {} --apply-immediately'.format(retention),
+            capture=True)
+    while True:
+        time.sleep(15)
+        instance = rds.describe_db_instances(DBInstanceIdentifier=name)['DBInstances'][0]
+        if (instance['BackupRetentionPeriod'] >= retention and
+                instance['DBInstanceStatus'] == 'available'):
+            break
+
+
+@task
+def aws_create_db_replica(index=0):
+    """ Create a read replica of the project database, turning on the
+    backups replicas need if they're off.
+    """
+    aws_enable_db_backups()
+    name = '$project-replica{}'.format(index)
+    cmd = (
+        '$aws rds create-db-instance-read-replica'
+        ' --db-instance-identifier {}'
+        ' --source-db-instance-identifier $project'
+        ' --db-instance-class db.t2.micro'
+    ).format(name)
+    run_cfg(cmd, capture=True)
+    run_cfg('$aws rds wait db-instance-available'
+            ' --db-instance-identifier {}'.format(name))
+    return aws_get_db_endpoint(name, fresh=True)
+
+
 @task
-def aws_create_db():
+def aws_create_db(replicas=0):
 
-    # Create the database and wait for it to be ready.
+    # Create the database and wait for it to be ready. Replicas can only
+    # be made of a database with automatic backups.
     sgid = aws_get_security_group_id()
+    retention = 1 if int(replicas) > 0 else 0
     cmd = (
         '$aws rds create-db-instance'
         ' --db-name $project'
@@ -909,16 +1455,17 @@ def aws_create_db():
         ' --allocated-storage 5'
         ' --master-username $project'
         ' --master-user-password $password'
-        ' --backup-retention-period 0'
+        ' --backup-retention-period $retention'
         ' --vpc-security-group-ids $sgid'
     )
     password = gen_secret(16)
-    res = run_cfg(cmd, capture=True, password=password, sgid=sgid)
+    res = run_cfg(cmd, capture=True, password=password, sgid=sgid,
+                  retention=str(retention))
     res = json.loads(res)
     run_cfg('$aws rds wait db-instance-available --db-instance-identifier $project')
 
     # Set the database URL in the environment.
-    endpoint = aws_get_db_endpoint()
+    endpoint = aws_get_db_endpoint(fresh=True)
     url = 'postgres://$project:$password@$address:$port/$project'
     url = subs(url, dev=False, extra={
         'password': password,
@@ -927,6 +1474,21 @@ def aws_create_db():
     })
     aws_config('set', 'DATABASE_URL', url)
 
+    # Replicas share the primary's credentials.
+    replica_urls = []
+    for index in range(int(replicas)):
+        replica = aws_create_db_replica(index)
+        replica_urls.append(subs(
+            'postgres://$project:$password@$address:$port/$project',
+            dev=False, extra={
+                'password': password,
+                'address': replica['Address'],
+                'port': str(replica['Port'])
+            }
+        ))
+    if replica_urls:
+        aws_config('set', 'DATABASE_REPLICA_URLS', ','.join(replica_urls))
+
     # Generate/add to the pgpass file.
     with open('pgpass', 'w') as ff:
         os.chmod('pgpass', 0o600)
@@ -938,25 +1500,38 @@ def aws_create_db():
 
 
 @task
-def aws_public_ip():
-    res = run_cfg('$aws ec2 describe-instances --filters Name=tag:project,'
-                  'Values=$project Name=tag:layout,Values=atto'
-                  ' Name=instance-state-name,Values=running',
-                  capture=True)
-    res = json.loads(res)
-    if not res['Reservations']:
-        print('No EC2 reservations active!')
-    for rsrv in res['Reservations']:
-        try:
-            ip = rsrv['Instances'][0]['PublicIpAddress']
-        except:
-            pass
-        else:
-            break
+def aws_public_ip(fresh=False):
+    def lookup():
+        res = aws_client('ec2').describe_instances(Filters=[
+            {'Name': 'tag:project', 'Values': [subs('$project', dev=False)]},
+            {'Name': 'tag:layout', 'Values': ['atto']},
+            {'Name': 'instance-state-name', 'Values': ['running']},
+        ])
+        if not res['Reservations']:
+            print('No EC2 reservations active!')
+        for rsrv in res['Reservations']:
+            try:
+                return rsrv['Instances'][0]['PublicIpAddress']
+            except:
+                pass
+    ip = aws_cached('public_ip', lookup, fresh)
     print(ip)
     return ip
 
 
+@task
+def aws_discover():
+    """ Look up the server and database addresses together.
+
+    Also warms the cache for the tasks that need them.
+    """
+    with ThreadPoolExecutor(2) as pool:
+        ip = pool.submit(aws_public_ip, True)
+        endpoint = pool.submit(aws_get_db_endpoint, None, True)
+        print('Database: {Address}:{Port}'.format(**endpoint.result()))
+        ip.result()
+
+
 def aws_add_env():
     cfg = prod_cfg()
     env.hosts = [aws_public_ip()]
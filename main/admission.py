@@ -0,0 +1,220 @@
+""" Admission control for HTTP requests entering daphne.
+
+Daphne hands every request to the channel layer and only finds out the
+workers are overwhelmed once the channel is full, or when the request
+times out. Wrapping the layer lets each daphne process turn requests
+away up front with a 503 and `Retry-After` once it has too many in
+flight or the request channel is filling, while health checks and
+authenticated API calls are let through for longer.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from twisted.internet import defer, reactor
+
+from .lanes import channel_depth
+
+
+logger = logging.getLogger(__name__)
+
+REQUEST_CHANNEL = 'http.request'
+
+DISCONNECT_CHANNEL = 'http.disconnect'
+
+
+def admission_control(layer):
+    if not settings.ADMISSION['ENABLED']:
+        return layer
+    return AdmissionControl(layer, **{
+        k.lower(): v for k, v in settings.ADMISSION.items() if k != 'ENABLED'
+    })
+
+
+class AdmissionControl(object):
+    """ Channel layer wrapper that sheds HTTP requests early.
+
+    Requests that are turned away never reach the layer; their 503 is
+    handed straight back to daphne on its next `receive` or
+    `receive_twisted`.
+    """
+    def __init__(self, layer, max_in_flight, max_fill, priority_max_fill,
+                 priority_factor, retry_after, exempt_paths, priority_paths,
+                 timeout):
+        self.layer = layer
+        self.max_in_flight = max_in_flight
+        self.max_fill = max_fill
+        self.priority_max_fill = priority_max_fill
+        self.priority_factor = priority_factor
+        self.retry_after = retry_after
+        self.exempt_paths = tuple(exempt_paths)
+        self.priority_paths = tuple(priority_paths)
+        self.timeout = timeout
+        self.in_flight = {}
+        self.rejected = {}
+        self.shed = 0
+        self._fill = (0.0, 0.0)
+        self._reading = None
+        self._waiter = None
+        self._unclaimed = None
+        self._lock = threading.Lock()
+        self._session_cookie = settings.SESSION_COOKIE_NAME.encode()
+
+    def __getattr__(self, name):
+        return getattr(self.layer, name)
+
+    def send(self, channel, message):
+        if channel == DISCONNECT_CHANNEL:
+            # The client went away, so no response will be received.
+            with self._lock:
+                self.in_flight.pop(message.get('reply_channel'), None)
+                self.rejected.pop(message.get('reply_channel'), None)
+        if channel != REQUEST_CHANNEL:
+            return self.layer.send(channel, message)
+        if not self.admit(message):
+            self.reject(message)
+            return
+        try:
+            self.layer.send(channel, message)
+        except Exception:
+            with self._lock:
+                self.in_flight.pop(message['reply_channel'], None)
+            raise
+
+    def receive(self, channels, block=False):
+        channels = list(channels)
+        rejection = self._pop_rejection(channels)
+        if rejection is not None:
+            return rejection
+        return self._received(self.layer.receive(channels, block=block))
+
+    def receive_twisted(self, channels):
+        """ Twisted-native `receive`, used by daphne's twisted reader.
+
+        The layer's read blocks in Redis for a while, so a request
+        rejected meanwhile wakes the reader with its 503 straight away.
+        The read carries on, and a message it brings back is handed to
+        the next call.
+        """
+        channels = list(channels)
+        result = self._pop_rejection(channels)
+        if result is None and self._unclaimed is not None:
+            result, self._unclaimed = self._unclaimed, None
+        if result is not None:
+            return defer.succeed(result)
+        waiter = defer.Deferred()
+        self._waiter = (waiter, channels)
+        if self._reading is None:
+            self._reading = self.layer.receive_twisted(channels)
+            self._reading.addCallbacks(self._read, self._read_failed)
+        return waiter
+
+    def _read(self, result):
+        self._reading = None
+        result = self._received(result)
+        if self._waiter is not None:
+            waiter, _ = self._waiter
+            self._waiter = None
+            waiter.callback(result)
+        elif result[0] is not None:
+            self._unclaimed = result
+
+    def _read_failed(self, failure):
+        self._reading = None
+        if self._waiter is not None:
+            waiter, _ = self._waiter
+            self._waiter = None
+            waiter.errback(failure)
+        else:
+            logger.error('Unable to receive from the channel layer: %s', failure.value)
+
+    def _wake(self):
+        if self._waiter is None:
+            return
+        waiter, channels = self._waiter
+        rejection = self._pop_rejection(channels)
+        if rejection is not None:
+            self._waiter = None
+            waiter.callback(rejection)
+
+    def _pop_rejection(self, channels):
+        with self._lock:
+            for reply_channel in list(self.rejected):
+                if self._listening(reply_channel, channels):
+                    return reply_channel, self.rejected.pop(reply_channel)
+
+    def _received(self, result):
+        channel, message = result
+        if channel is not None and not message.get('more_content', False):
+            with self._lock:
+                self.in_flight.pop(channel, None)
+        return channel, message
+
+    def admit(self, message):
+        """ Whether to pass a request on, taking an in-flight slot if so.
+        """
+        path = message.get('path', '')
+        exempt = path.startswith(self.exempt_paths)
+        priority = path.startswith(self.priority_paths) and self._has_session(message)
+        now = time.monotonic()
+        fill = 0.0 if exempt else self.fill_level(now)
+        with self._lock:
+            for reply_channel, started in list(self.in_flight.items()):
+                if now - started > self.timeout:
+                    del self.in_flight[reply_channel]
+            if not exempt:
+                limit = self.max_in_flight * (self.priority_factor if priority else 1)
+                if len(self.in_flight) >= limit:
+                    return False
+                if fill >= (self.priority_max_fill if priority else self.max_fill):
+                    return False
+            self.in_flight[message['reply_channel']] = now
+        return True
+
+    def fill_level(self, now):
+        """ Fraction of the request channel's capacity in use.
+
+        Read at most once a second.
+        """
+        checked, fill = self._fill
+        if now - checked >= 1.0:
+            try:
+                capacity = self.layer.get_capacity(REQUEST_CHANNEL)
+                fill = channel_depth(self.layer, REQUEST_CHANNEL) / capacity
+            except Exception:
+                logger.exception('Unable to read the request channel fill level.')
+                fill = 0.0
+            self._fill = (now, fill)
+        return fill
+
+    def reject(self, message):
+        self.shed += 1
+        logger.warning('count#http.shed=1 path=%s', message.get('path', ''))
+        with self._lock:
+            self.rejected[message['reply_channel']] = {
+                'status': 503,
+                'headers': [
+                    (b'Content-Type', b'text/plain'),
+                    (b'Retry-After', str(self.retry_after).encode()),
+                ],
+                'content': b'Service Unavailable',
+                'more_content': False,
+            }
+        if self._waiter is not None:
+            # Daphne is still inside `send`, so answer once it's done.
+            reactor.callLater(0, self._wake)
+
+    def _has_session(self, message):
+        for name, value in message.get('headers', []):
+            if name.lower() == b'cookie' and self._session_cookie + b'=' in value:
+                return True
+        return False
+
+    def _listening(self, reply_channel, channels):
+        if reply_channel in channels:
+            return True
+
+        # Process local channels are received through their prefix.
+        prefix, sep, _ = reply_channel.partition('!')
+        return bool(sep) and prefix + sep in channels
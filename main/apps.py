@@ -1,5 +1,28 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_started, setting_changed
+from django.db.backends.signals import connection_created
 
 
 class MainConfig(AppConfig):
     name = 'main'
+
+    def ready(self):
+        from channels.signals import consumer_started
+        from . import signals
+        from .db import check_connections, connection_opened
+        setting_changed.connect(url_setting_changed)
+        connection_created.connect(connection_opened)
+        request_started.connect(check_connections)
+        consumer_started.connect(check_connections)
+        from .webpack import preload
+        preload(settings.WEBPACK_LOADER)
+        if settings.PROFILER_ENABLED:
+            from .profiler import install_signal_handler
+            install_signal_handler()
+
+
+def url_setting_changed(setting, **kwargs):
+    if setting in ('ROOT_URLCONF', 'ROOT_ROUTERCONF'):
+        from .views import clear_api_cache
+        clear_api_cache()
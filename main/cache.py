@@ -0,0 +1,384 @@
+import logging
+import pickle
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import cache as default_cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django_redis.cache import RedisCache, omit_exception
+from django_redis.exceptions import ConnectionInterrupted
+from redis.exceptions import ConnectionError, ResponseError, TimeoutError
+
+from .metrics import timed
+
+
+logger = logging.getLogger(__name__)
+
+_missing = object()
+
+
+class LocalLRU(object):
+    """ A bounded, thread safe LRU with per-entry expiry.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return _missing
+            if expires <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return _missing
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LocalTier(object):
+    """ A process's local copy of one Redis cache.
+
+    Django keeps a cache instance per thread, so the LRU and the pub/sub
+    listener keeping it current live here instead, shared by every
+    instance for the same location and key prefix. That keeps one copy
+    of each entry, and one pooled connection held by a listener, per
+    process.
+    """
+    def __init__(self, max_entries, channel):
+        self.lru = LocalLRU(max_entries)
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def ensure_listener(self, client):
+        if self._listener is not None:
+            return
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen, args=(client,),
+                    name='cache-invalidation', daemon=True
+                )
+                self._listener.start()
+
+    def _listen(self, client):
+        while True:
+            try:
+                pubsub = client.get_client(write=False).pubsub(
+                    ignore_subscribe_messages=True
+                )
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    data = message['data']
+                    if isinstance(data, bytes):
+                        data = data.decode()
+                    origin, _, key = data.partition(' ')
+                    if origin == self.origin:
+                        continue
+                    if key == '*':
+                        self.lru.clear()
+                    else:
+                        self.lru.delete(key)
+            except Exception:
+                logger.exception('Cache invalidation listener failed, retrying.')
+
+                # Invalidations may have been missed while disconnected.
+                self.lru.clear()
+                time.sleep(1)
+
+
+# Local tiers by location and key prefix.
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+def get_local_tier(location, key_prefix, max_entries):
+    if not isinstance(location, str):
+        location = tuple(location)
+    key = (location, key_prefix)
+    with _tiers_lock:
+        try:
+            tier = _tiers[key]
+        except KeyError:
+            channel = '%s:invalidate' % (key_prefix or 'cache')
+            tier = _tiers[key] = LocalTier(max_entries, channel)
+        return tier
+
+
+class TwoTierRedisCache(RedisCache):
+    """ Redis cache with an in-process LRU in front of it.
+
+    Reads are served from the local tier when possible. Writes go
+    straight to Redis and drop the key locally, then publish the key so
+    every other process drops it too. Entries never live locally for
+    longer than `LOCAL_TIMEOUT` seconds, which bounds staleness should
+    an invalidation be missed, nor past their expiry in Redis, which is
+    read along with the value.
+    """
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        options = params.get('OPTIONS', {})
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._tier = get_local_tier(
+            server, self.key_prefix, options.get('LOCAL_MAX_ENTRIES', 1000)
+        )
+        self._local = self._tier.lru
+
+    def stats(self):
+        return {
+            'hits': self._local.hits,
+            'misses': self._local.misses,
+            'evictions': self._local.evictions,
+            'size': len(self._local),
+        }
+
+    @timed('cache')
+    @omit_exception(return_value=None)
+    def get(self, key, default=None, version=None, **kwargs):
+        local_key = self.make_key(key, version=version)
+        value = self._local_get(local_key)
+        if value is not _missing:
+            return value
+        value = self._fetch([local_key]).get(local_key, _missing)
+        return default if value is _missing else value
+
+    @timed('cache')
+    @omit_exception(return_value={})
+    def get_many(self, keys, version=None, **kwargs):
+        found = {}
+        remaining = {}
+        for key in keys:
+            local_key = self.make_key(key, version=version)
+            value = self._local_get(local_key)
+            if value is _missing:
+                remaining[local_key] = key
+            else:
+                found[key] = value
+        if remaining:
+            fetched = self._fetch(list(remaining))
+            for local_key, value in fetched.items():
+                found[remaining[local_key]] = value
+        return found
+
+    @timed('cache')
+    def has_key(self, key, version=None, **kwargs):
+        if self._local_get(self.make_key(key, version=version)) is not _missing:
+            return True
+        return super().has_key(key, version=version, **kwargs)
+
+    @timed('cache')
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, **kwargs):
+        try:
+            return super().set(key, value, timeout, version=version, **kwargs)
+        finally:
+            self._invalidate([key], version)
+
+    @timed('cache')
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, **kwargs):
+        try:
+            return super().add(key, value, timeout, version=version, **kwargs)
+        finally:
+            self._invalidate([key], version)
+
+    @timed('cache')
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None, **kwargs):
+        try:
+            return super().set_many(data, timeout, version=version, **kwargs)
+        finally:
+            self._invalidate(data.keys(), version)
+
+    @timed('cache')
+    def delete(self, key, version=None, **kwargs):
+        try:
+            return super().delete(key, version=version, **kwargs)
+        finally:
+            self._invalidate([key], version)
+
+    @timed('cache')
+    def delete_many(self, keys, version=None, **kwargs):
+        keys = list(keys)
+        try:
+            return super().delete_many(keys, version=version, **kwargs)
+        finally:
+            self._invalidate(keys, version)
+
+    @timed('cache')
+    def delete_pattern(self, *args, **kwargs):
+        try:
+            return super().delete_pattern(*args, **kwargs)
+        finally:
+            self._invalidate_all()
+
+    @timed('cache')
+    def incr(self, key, delta=1, version=None, **kwargs):
+        try:
+            return super().incr(key, delta, version=version, **kwargs)
+        finally:
+            self._invalidate([key], version)
+
+    @timed('cache')
+    def decr(self, key, delta=1, version=None, **kwargs):
+        try:
+            return super().decr(key, delta, version=version, **kwargs)
+        finally:
+            self._invalidate([key], version)
+
+    @timed('cache')
+    def expire(self, key, *args, **kwargs):
+        try:
+            return super().expire(key, *args, **kwargs)
+        finally:
+            self._invalidate([key], kwargs.get('version'))
+
+    @timed('cache')
+    def persist(self, key, *args, **kwargs):
+        try:
+            return super().persist(key, *args, **kwargs)
+        finally:
+            self._invalidate([key], kwargs.get('version'))
+
+    @timed('cache')
+    def clear(self):
+        try:
+            return super().clear()
+        finally:
+            self._invalidate_all()
+
+    def _fetch(self, local_keys):
+        """ Read keys and their TTLs from Redis in one round trip,
+        keeping what's found locally until the earlier of the two
+        expiries.
+        """
+        client = self.client.get_client(write=False)
+        pipe = client.pipeline(transaction=False)
+        pipe.mget(local_keys)
+        for key in local_keys:
+            pipe.pttl(key)
+        try:
+            values, *ttls = pipe.execute()
+        except (ConnectionError, ResponseError, TimeoutError, socket.timeout) as exc:
+            raise ConnectionInterrupted(connection=client, parent=exc)
+        found = {}
+        for key, value, ttl in zip(local_keys, values, ttls):
+            if value is None:
+                continue
+            value = self.client.decode(value)
+            found[key] = value
+            if ttl == -1:
+                self._local_set(key, value)
+            elif ttl > 0:
+                self._local_set(key, value, ttl / 1000)
+        return found
+
+    def _local_get(self, local_key):
+        self._tier.ensure_listener(self.client)
+        value = self._local.get(local_key)
+        if value is _missing:
+            return value
+        return pickle.loads(value)
+
+    def _local_set(self, local_key, value, ttl=None):
+        timeout = self.local_timeout if ttl is None else min(ttl, self.local_timeout)
+        if timeout > 0:
+            value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            self._local.set(local_key, value, timeout)
+
+    def _invalidate(self, keys, version):
+        keys = [self.make_key(k, version=version) for k in keys]
+        for key in keys:
+            self._local.delete(key)
+        self._publish(keys)
+
+    def _invalidate_all(self):
+        self._local.clear()
+        self._publish(['*'])
+
+    def _publish(self, keys):
+        try:
+            client = self.client.get_client(write=True)
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                pipe.publish(self._tier.channel, '%s %s' % (self._tier.origin, key))
+            pipe.execute()
+        except Exception:
+            logger.exception('Failed to publish cache invalidation.')
+
+
+class CacheBatch(object):
+    """ Batches the cache traffic of a single request.
+
+    Keys registered with `want` are fetched together, with one `MGET`,
+    the first time any of them is read. Writes are held until `flush`,
+    which sends them with one pipelined `set_many` per distinct timeout.
+    """
+    def __init__(self, cache=None):
+        self.cache = cache or default_cache
+        self._wanted = set()
+        self._values = {}
+        self._writes = {}
+
+    def want(self, *keys):
+        self._wanted.update(k for k in keys if k not in self._values)
+
+    def get(self, key, default=None):
+        if key not in self._values:
+            self.want(key)
+            self.fetch()
+        value = self._values[key]
+        return default if value is _missing else value
+
+    def get_many(self, keys):
+        self.want(*keys)
+        if self._wanted:
+            self.fetch()
+        return {
+            k: self._values[k] for k in keys if self._values[k] is not _missing
+        }
+
+    def fetch(self):
+        keys = list(self._wanted)
+        self._wanted.clear()
+        found = self.cache.get_many(keys)
+        for key in keys:
+            self._values[key] = found.get(key, _missing)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self._values[key] = value
+        self._writes.setdefault(timeout, {})[key] = value
+
+    def flush(self):
+        writes, self._writes = self._writes, {}
+        for timeout, data in writes.items():
+            self.cache.set_many(data, timeout)
@@ -0,0 +1,107 @@
+import logging
+import random
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+# Per alias counts of connections opened, and of persistent
+# connections discarded by health checks, in this process.
+connection_stats = {
+    'opened': Counter(),
+    'unusable': Counter(),
+}
+
+
+def connection_opened(connection, **kwargs):
+    connection_stats['opened'][connection.alias] += 1
+    logger.info(
+        'count#db.connection.opened=1 alias=%s total=%d',
+        connection.alias, connection_stats['opened'][connection.alias]
+    )
+
+
+def check_connections(**kwargs):
+    """ Discard persistent connections that have stopped working.
+
+    Costs a round trip per open connection, so it only runs when
+    `DB_HEALTH_CHECKS` is enabled.
+    """
+    if not settings.DB_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        if not connection.is_usable():
+            connection_stats['unusable'][connection.alias] += 1
+            logger.warning(
+                'Discarding unusable database connection (%s).',
+                connection.alias
+            )
+            connection.close()
+
+
+_state = threading.local()
+
+
+def use_replicas(enabled):
+    _state.use_replicas = enabled
+
+
+def sticky_key(session_key):
+    return 'db:sticky:%s' % session_key
+
+
+def is_sticky(session_key):
+    return bool(session_key) and cache.get(sticky_key(session_key)) is not None
+
+
+def make_sticky(session_key):
+    """ Send this session's reads to the primary for a little while.
+
+    Gives replicas time to catch up with what the session just wrote.
+    """
+    cache.set(sticky_key(session_key), 1, settings.REPLICA_STICKY_SECONDS)
+
+
+class ReplicaRouter(object):
+    """ Route reads to a replica while `use_replicas` is on.
+
+    Replicas are the databases whose aliases start with `replica`. Reads
+    inside a replica-safe request go to one of them, unless the hints
+    name an instance that already belongs to a database. Writes never
+    go to a replica, and replicas are never migrated. Everything else
+    is left to other routers and Django's defaults.
+    """
+    def __init__(self):
+        self.replicas = [a for a in settings.DATABASES if a.startswith('replica')]
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return None
+        if self.replicas and getattr(_state, 'use_replicas', False):
+            return random.choice(self.replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in self.replicas:
+            return 'default'
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = set(self.replicas) | {'default'}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in self.replicas:
+            return False
+        return None
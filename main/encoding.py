@@ -0,0 +1,38 @@
+""" JSON encoding backend for the API.
+
+Uses orjson when it's installed and the standard library otherwise.
+Values orjson doesn't handle natively, or handles differently from DRF
+(dates, times and Decimals), are passed to DRF's encoder so output
+matches the standard renderer.
+"""
+import json
+
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+_encoder = encoders.JSONEncoder()
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(
+            data, default=_encoder.default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        )
+    return json.dumps(
+        data, cls=encoders.JSONEncoder, ensure_ascii=False,
+        separators=(',', ':')
+    ).encode()
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
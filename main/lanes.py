@@ -0,0 +1,287 @@
+""" Priority lanes for the task queue.
+
+Each lane is its own channel with its own capacity. Workers receiving
+from several lanes at once take from them in a weighted random order,
+so busy bulk lanes slow latency sensitive ones down without starving
+them. Lanes are configured by `CQ_LANES` in settings, and tasks are
+queued on one with `delay`, or many at a time with `delay_many`.
+"""
+import logging
+import random
+import threading
+import time
+import uuid
+
+from channels import Channel, DEFAULT_CHANNEL_LAYER, channel_layers
+from channels.routing import route
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from redis_channel_layer import DjangoRedisChannelLayer
+
+from .pool import SharedPoolMixin
+
+
+logger = logging.getLogger(__name__)
+
+SENT_KEY = '_lane_sent'
+
+
+def channel_depth(layer, channel):
+    """ Number of messages waiting on a channel of a Redis layer.
+    """
+    connection = layer.connection(layer.consistent_hash(channel))
+    return connection.llen(layer.prefix + channel)
+
+
+def lane_routes(routing, channel, lanes):
+    """ Route every lane to the consumers of `channel`.
+    """
+    routes = []
+    for rt in routing:
+        if channel not in getattr(rt, 'channels', ()):
+            continue
+        for lane in lanes.values():
+            routes.append(route(lane['channel'], rt.consumer))
+    return routes
+
+
+def get_task_layer_alias():
+    return getattr(settings, 'CQ_CHANNEL_LAYER', DEFAULT_CHANNEL_LAYER)
+
+
+def send_task(task, lane):
+    """ Queue a submitted cq task on `lane`.
+
+    Mirrors `cq.models.Task.send`, which only knows the default lane.
+    """
+    alias = get_task_layer_alias()
+    channel = settings.CQ_LANES[lane]['channel']
+    try:
+        Channel(channel, alias=alias).send({
+            'task_id': str(task.id),
+        }, immediately=True)
+    except DjangoRedisChannelLayer.ChannelFull:
+        logger.warning('Lane %s is full, task %s will be retried.', lane, task.id)
+        with cache.lock(str(task.id), timeout=2):
+            task.status = task.STATUS_RETRY
+            task.save(update_fields=('status',))
+
+
+def delay(lane, func, args=(), kwargs=None, **task_args):
+    """ Like `cq.models.delay`, but queue the task on `lane`.
+    """
+    from cq.models import delay as cq_delay
+
+    if lane not in settings.CQ_LANES:
+        raise ValueError('Unknown task queue lane: %s' % lane)
+    task = cq_delay(func, args, kwargs or {}, submit=False, **task_args)
+    task.send = lambda: send_task(task, lane)
+    task.submit()
+    return task
+
+
+def send_tasks(tasks, lane):
+    """ Queue submitted cq tasks on `lane` in one round trip.
+
+    Tasks that don't fit in the lane are marked for retry, as
+    `send_task` does.
+    """
+    from cq.models import Task
+
+    layer = channel_layers[get_task_layer_alias()].channel_layer
+    if not hasattr(layer, 'send_many'):
+        for task in tasks:
+            send_task(task, lane)
+        return
+    channel = settings.CQ_LANES[lane]['channel']
+    sent = layer.send_many(channel, [{'task_id': str(t.id)} for t in tasks])
+    unsent = tasks[sent:]
+    if unsent:
+        logger.warning('Lane %s is full, %d tasks will be retried.', lane, len(unsent))
+        Task.objects.filter(id__in=[t.id for t in unsent]).update(
+            status=Task.STATUS_RETRY
+        )
+        for task in unsent:
+            task.status = task.STATUS_RETRY
+
+
+def delay_many(lane, calls, **task_args):
+    """ Queue a task on `lane` for each `(func, args, kwargs)` in `calls`.
+
+    The tasks are created with one query and sent with one round trip
+    once the transaction commits, instead of the few queries, a lock and
+    a send each that `delay` costs per task.
+    """
+    from cq.models import Task
+    from cq.task import to_signature
+
+    if lane not in settings.CQ_LANES:
+        raise ValueError('Unknown task queue lane: %s' % lane)
+    tasks = [
+        Task(signature=to_signature(func, args, kwargs or {}),
+             status=Task.STATUS_QUEUED, **task_args)
+        for func, args, kwargs in calls
+    ]
+    if not tasks:
+        return tasks
+    with transaction.atomic():
+        Task.objects.bulk_create(tasks)
+        transaction.on_commit(lambda: send_tasks(tasks, lane))
+    return tasks
+
+
+class LaneStats(object):
+
+    def __init__(self):
+        self.sent = 0
+        self.full = 0
+        self.received = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def as_dict(self):
+        return {
+            'sent': self.sent,
+            'full': self.full,
+            'received': self.received,
+            'wait_total': self.wait_total,
+            'wait_max': self.wait_max,
+        }
+
+
+class LanedChannelLayer(SharedPoolMixin, DjangoRedisChannelLayer):
+    """ Channel layer aware of task queue lanes.
+
+    Takes a `lanes` option mapping lane names to their `channel`,
+    `capacity` and `weight`. Messages sent to a lane are timestamped so
+    the time they spend queued can be reported per lane. Connections
+    come from the cache's pool.
+    """
+    def __init__(self, *args, lanes=None, **kwargs):
+        self.lanes = lanes or {}
+        capacities = dict(kwargs.pop('channel_capacity', None) or {})
+        for lane in self.lanes.values():
+            capacities.setdefault(lane['channel'], lane['capacity'])
+        super().__init__(*args, channel_capacity=capacities, **kwargs)
+        self.lane_names = {l['channel']: n for n, l in self.lanes.items()}
+        self.lane_weights = {l['channel']: l['weight'] for l in self.lanes.values()}
+        self._stats = {name: LaneStats() for name in self.lanes}
+        self._stats_lock = threading.Lock()
+        self.chansend_many = self.connection(None).register_script(self.lua_chansend_many)
+
+    def send(self, channel, message):
+        lane = self.lane_names.get(channel)
+        if lane is None:
+            return super().send(channel, message)
+        message = dict(message)
+        message[SENT_KEY] = time.time()
+        try:
+            super().send(channel, message)
+        except self.ChannelFull:
+            with self._stats_lock:
+                self._stats[lane].full += 1
+            raise
+        with self._stats_lock:
+            self._stats[lane].sent += 1
+
+    def send_many(self, channel, messages):
+        """ Send several messages to one channel in a single round trip.
+
+        Messages are queued in order until the channel is full,
+        returning the number of messages sent.
+        """
+        lane = self.lane_names.get(channel)
+        messages = list(messages)
+        if not messages:
+            return 0
+        keys = [self.prefix + channel]
+        args = [self.get_capacity(channel), self.expiry]
+        for message in messages:
+            if lane is not None:
+                message = dict(message)
+                message[SENT_KEY] = time.time()
+            keys.append(self.prefix + uuid.uuid4().hex)
+            args.append(self.serialize(message))
+        if '!' in channel or '?' in channel:
+            connection = self.connection(self.consistent_hash(channel))
+        else:
+            connection = self.connection(None)
+        sent = self.chansend_many(keys=keys, args=args, client=connection)
+        if lane is not None:
+            with self._stats_lock:
+                self._stats[lane].sent += sent
+                if sent < len(messages):
+                    self._stats[lane].full += 1
+        return sent
+
+    lua_chansend_many = """
+        local sent = 0
+        local room = tonumber(ARGV[1]) - redis.call('llen', KEYS[1])
+        for i = 2, math.min(#KEYS, room + 1) do
+            redis.call('set', KEYS[i], ARGV[i + 1])
+            redis.call('expire', KEYS[i], ARGV[2])
+            redis.call('rpush', KEYS[1], KEYS[i])
+            sent = sent + 1
+        end
+        if sent > 0 then
+            redis.call('expire', KEYS[1], ARGV[2] + 1)
+        end
+        return sent
+    """
+
+    def receive(self, channels, block=False):
+        channels = list(channels)
+        lanes = [c for c in channels if c in self.lane_weights]
+
+        # Only weigh lanes against each other. Mixing them with other
+        # channels would favour tasks over requests.
+        if len(lanes) > 1 and len(lanes) == len(channels):
+            for channel in self.weighted_order(lanes):
+                channel, message = super().receive([channel], block=False)
+                if channel is not None:
+                    return self._received(channel, message)
+        channel, message = super().receive(channels, block=block)
+        return self._received(channel, message)
+
+    def weighted_order(self, channels):
+        remaining = list(channels)
+        order = []
+        while remaining:
+            point = random.uniform(0, sum(self.lane_weights[c] for c in remaining))
+            for channel in remaining:
+                point -= self.lane_weights[channel]
+                if point <= 0:
+                    break
+            remaining.remove(channel)
+            order.append(channel)
+        return order
+
+    def lane_depth(self, name):
+        """ Number of messages waiting in a lane, if it can be found.
+        """
+        try:
+            return channel_depth(self, self.lanes[name]['channel'])
+        except Exception:
+            logger.exception('Unable to read the depth of lane %s.', name)
+            return None
+
+    def lane_stats(self):
+        with self._stats_lock:
+            stats = {name: s.as_dict() for name, s in self._stats.items()}
+        for name in stats:
+            stats[name]['depth'] = self.lane_depth(name)
+        return stats
+
+    def _received(self, channel, message):
+        lane = self.lane_names.get(channel)
+        if lane is not None and message is not None:
+            sent = message.pop(SENT_KEY, None)
+            with self._stats_lock:
+                stats = self._stats[lane]
+                stats.received += 1
+                if sent is not None:
+                    wait = max(time.time() - sent, 0.0)
+                    stats.wait_total += wait
+                    stats.wait_max = max(stats.wait_max, wait)
+        return channel, message
@@ -0,0 +1,111 @@
+""" Structured, non-blocking logging.
+
+`AsyncStreamHandler` only puts records on a queue; a listener thread
+formats and writes them, so slow stdout never holds up a request.
+`JSONFormatter` writes one JSON object per line, including the id and
+view of the request being handled when the record was logged.
+`SamplingFilter` keeps a fraction of the records from noisy loggers.
+"""
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+import traceback
+from logging.handlers import QueueHandler, QueueListener
+
+from . import metrics
+
+
+# Attributes every LogRecord has; anything else was passed as `extra`.
+RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if not hasattr(record, 'request_id'):
+            record.request_id, record.view = metrics.current()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRS and value is not None:
+                data[key] = value
+        return json.dumps(data, default=str)
+
+
+class AsyncStreamHandler(QueueHandler):
+    """ Write to a stream from a background thread.
+
+    The queue is bounded; when it's full records are dropped rather
+    than blocking, and the number dropped is reported once there's
+    room again.
+    """
+    def __init__(self, stream=None, queue_size=10000):
+        super().__init__(queue.Queue(queue_size))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.dropped = 0
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Resolve everything that depends on the logging thread or on
+        # objects that may change before the listener gets to them. As
+        # in the standard library, this works on a copy, so the other
+        # handlers of the record still see the original.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = ''.join(
+                    traceback.format_exception(*record.exc_info)
+                ).rstrip()
+            record.exc_info = None
+        if not hasattr(record, 'request_id'):
+            record.request_id, record.view = metrics.current()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped:
+            try:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': __name__, 'levelno': logging.WARNING,
+                    'levelname': 'WARNING',
+                    'msg': 'Dropped %d log records.' % self.dropped,
+                }))
+            except queue.Full:
+                return
+            self.dropped = 0
+
+
+class SamplingFilter(logging.Filter):
+    """ Keep `rate` of the records below `level`.
+    """
+    def __init__(self, rate=1.0, level='WARNING'):
+        super().__init__()
+        self.rate = float(rate)
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+
+    def filter(self, record):
+        return record.levelno >= self.level or random.random() < self.rate
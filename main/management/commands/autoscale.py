@@ -0,0 +1,115 @@
+import logging
+import time
+import urllib.request
+from xmlrpc.client import ServerProxy
+
+import psutil
+from channels import channel_layers
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...lanes import channel_depth
+
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATES = ('STARTING', 'RUNNING', 'BACKOFF')
+
+
+class Command(BaseCommand):
+    help = 'Start and stop supervisor processes to follow load.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            default=settings.AUTOSCALE['INTERVAL'])
+
+    def handle(self, *args, **options):
+        config = settings.AUTOSCALE
+        if not config['ENABLED']:
+            self.stdout.write('Autoscaling is disabled.')
+            return
+        self.config = config
+        self.supervisor = ServerProxy(config['SUPERVISOR_URL']).supervisor
+        self.quiet = {group: 0 for group in config['GROUPS']}
+        psutil.cpu_percent()
+        while True:
+            time.sleep(options['interval'])
+            try:
+                self.step()
+            except Exception:
+                logger.exception('Autoscaling step failed.')
+
+    def step(self):
+        processes = self.supervisor.getAllProcessInfo()
+        readings = self.readings()
+        for group, group_config in self.config['GROUPS'].items():
+            members = sorted(
+                (p for p in processes if p['group'] == group),
+                key=lambda p: p['name']
+            )
+            if not members:
+                continue
+            pressure = self.pressure(group_config, readings)
+            self.scale(group, group_config, members, pressure)
+
+    def readings(self):
+        """ Load relative to target of each signal a group scales on.
+
+        Signals are sampled once per step and shared by the groups. CPU
+        usage is measured since the previous sample, so a second reading
+        in the same step would cover next to no time.
+        """
+        signals = set()
+        for group_config in self.config['GROUPS'].values():
+            signals.update(group_config['signals'])
+        readings = {}
+        if 'cpu' in signals:
+            readings['cpu'] = psutil.cpu_percent() / self.config['CPU_TARGET']
+        if 'latency' in signals and self.config['PROBE_URL']:
+            readings['latency'] = self.probe() / self.config['LATENCY_TARGET']
+        if 'backlog' in signals:
+            readings['backlog'] = self.backlog() / self.config['BACKLOG_TARGET']
+        return readings
+
+    def pressure(self, group_config, readings):
+        """ Load relative to target; above 1 wants more processes.
+        """
+        values = [readings[s] for s in group_config['signals'] if s in readings]
+        return max(values) if values else 0.0
+
+    def probe(self):
+        start = time.monotonic()
+        try:
+            urllib.request.urlopen(self.config['PROBE_URL'], timeout=10).read()
+        except Exception:
+            logger.warning('Latency probe failed.')
+            return 10.0
+        return time.monotonic() - start
+
+    def backlog(self):
+        total = 0
+        for alias, channels in self.config['BACKLOG_CHANNELS'].items():
+            layer = channel_layers[alias].channel_layer
+            for channel in channels:
+                total += channel_depth(layer, channel)
+        return total
+
+    def scale(self, group, group_config, members, pressure):
+        active = [p for p in members if p['statename'] in ACTIVE_STATES]
+        idle = [p for p in members if p['statename'] not in ACTIVE_STATES]
+        minimum = min(group_config['min'], len(members))
+        if pressure > 1.0 or len(active) < minimum:
+            self.quiet[group] = 0
+            if idle:
+                name = '%s:%s' % (group, idle[0]['name'])
+                logger.info('Starting %s (pressure %.2f).', name, pressure)
+                self.supervisor.startProcess(name, False)
+        elif pressure < self.config['SCALE_DOWN_BELOW'] and len(active) > minimum:
+            self.quiet[group] += 1
+            if self.quiet[group] >= self.config['COOLDOWN']:
+                self.quiet[group] = 0
+                name = '%s:%s' % (group, active[-1]['name'])
+                logger.info('Stopping %s (pressure %.2f).', name, pressure)
+                self.supervisor.stopProcess(name, False)
+        else:
+            self.quiet[group] = 0
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django_redis.cache import RedisCache
+
+from ...cache import TwoTierRedisCache
+
+
+class Command(BaseCommand):
+    help = 'Compare read throughput and pool waits with and without the local cache tier.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--keys', type=int, default=200)
+        parser.add_argument('--max-connections', type=int,
+                            default=settings.REDIS_MAX_CONNECTIONS)
+
+    def handle(self, *args, **options):
+        for backend in (RedisCache, TwoTierRedisCache):
+            cache = backend(settings.CACHES['default']['LOCATION'], {
+                'KEY_PREFIX': 'benchcache',
+                'OPTIONS': {
+                    'CONNECTION_POOL_CLASS': 'main.pool.MeteredBlockingConnectionPool',
+                    'CONNECTION_POOL_KWARGS': {
+                        'max_connections': options['max_connections'],
+                        'timeout': settings.REDIS_POOL_TIMEOUT,
+                    },
+                },
+            })
+            self.run(backend.__name__, cache, options)
+
+    def run(self, name, cache, options):
+        keys = ['key%d' % i for i in range(options['keys'])]
+        cache.set_many({k: {'value': k} for k in keys}, 300)
+        pool = cache.client.get_client(write=False).connection_pool
+        pool.reset_wait_stats()
+        counts = []
+        end = time.monotonic() + options['seconds']
+
+        def worker():
+            count = 0
+            while time.monotonic() < end:
+                cache.get(keys[count % len(keys)])
+                count += 1
+            counts.append(count)
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        waits = pool.wait_stats()
+        self.stdout.write(
+            '%s: %.0f gets/s, %d connection checkouts, %.1fms mean wait,'
+            ' %.1fms max wait, %d slow' % (
+                name, sum(counts) / options['seconds'], waits['count'],
+                waits['total'] / max(waits['count'], 1) * 1000,
+                waits['max'] * 1000, waits['slow'],
+            )
+        )
+        cache.delete_many(keys)
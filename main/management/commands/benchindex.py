@@ -0,0 +1,43 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from ...views import IndexView, clear_api_cache
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-request cost of the index page with and without the cached API descriptor.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+
+    def handle(self, *args, **options):
+        view = IndexView.as_view()
+        factory = RequestFactory()
+        for name, prepare in (('rebuilt', clear_api_cache),
+                              ('cached', lambda: None)):
+            self.run(name, view, factory, prepare, options)
+
+    def run(self, name, view, factory, prepare, options):
+        view(self.make_request(factory)).render()
+        timings = []
+        for i in range(options['requests']):
+            request = self.make_request(factory)
+            prepare()
+            start = time.perf_counter()
+            view(request).render()
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        self.stdout.write(
+            '%s: %.0fus mean, %.0fus p99 per request' % (
+                name, sum(timings) / len(timings) * 1e6,
+                timings[int(len(timings) * 0.99)] * 1e6,
+            )
+        )
+
+    def make_request(self, factory):
+        request = factory.get('/')
+        request.user = AnonymousUser()
+        return request
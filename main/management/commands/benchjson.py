@@ -0,0 +1,69 @@
+import datetime
+import io
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework import parsers, renderers
+
+from ... import encoding
+from ...parsers import FastJSONParserMixin
+from ...renderers import FastJSONRendererMixin
+
+
+def make_document(size):
+    now = datetime.datetime(2017, 1, 1, 12, 30)
+    return {
+        'data': [{
+            'type': 'orders',
+            'id': str(i),
+            'attributes': {
+                'reference': 'ORD-%06d' % i,
+                'description': 'Café order number %d' % i,
+                'quantity': i % 17,
+                'price': Decimal('%d.95' % (i % 100)),
+                'paid': i % 2 == 0,
+                'created': now + datetime.timedelta(minutes=i),
+                'due': (now + datetime.timedelta(days=i % 30)).date(),
+                'tags': ['tag%d' % j for j in range(i % 5)],
+            },
+            'relationships': {
+                'customer': {'data': {'type': 'customers', 'id': str(i % 50)}},
+            },
+        } for i in range(size)],
+        'meta': {'pagination': {'count': size}},
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare JSON rendering and parsing with orjson and the standard library.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--resources', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if encoding.orjson is None:
+            raise CommandError('orjson is not installed.')
+        document = make_document(options['resources'])
+        body = renderers.JSONRenderer().render(document)
+        for name, renderer in (('stdlib', renderers.JSONRenderer()),
+                               ('orjson', FastJSONRendererMixin())):
+            self.run('%s render' % name, lambda: renderer.render(document), options)
+        context = {'encoding': 'utf-8'}
+        for name, parser in (('stdlib', parsers.JSONParser()),
+                             ('orjson', FastJSONParserMixin())):
+            self.run('%s parse' % name, lambda: parser.parse(
+                io.BytesIO(body), parser_context=context
+            ), options)
+        self.stdout.write('%.1fKB document, %d resources' % (
+            len(body) / 1024, options['resources']
+        ))
+
+    def run(self, name, func, options):
+        func()
+        start = time.perf_counter()
+        for i in range(options['repeat']):
+            func()
+        elapsed = (time.perf_counter() - start) / options['repeat']
+        self.stdout.write('%s: %.2fms per document' % (name, elapsed * 1000))
@@ -0,0 +1,81 @@
+import logging
+import os
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...log import AsyncStreamHandler, JSONFormatter
+
+
+class SlowStream(object):
+    """ A stream taking `delay` seconds per write, like a busy stdout.
+    """
+    def __init__(self, stream, delay):
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, data):
+        time.sleep(self.delay)
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class Command(BaseCommand):
+    help = 'Compare per-request logging overhead of synchronous and queued handlers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Requests per thread.')
+        parser.add_argument('--write-delay', type=float, default=0.0001,
+                            help='Seconds each write to the stream takes.')
+
+    def handle(self, *args, **options):
+        with open(os.devnull, 'w') as devnull:
+            stream = SlowStream(devnull, options['write_delay'])
+            for handler in (logging.StreamHandler(stream),
+                            AsyncStreamHandler(stream)):
+                handler.setFormatter(JSONFormatter())
+                self.run(type(handler).__name__, handler, options)
+                if isinstance(handler, AsyncStreamHandler):
+                    handler.queue.join()
+
+    def run(self, name, handler, options):
+        logger = logging.getLogger('benchlog.%s' % name)
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        timings = []
+
+        def worker():
+            local = []
+            for i in range(options['requests']):
+                start = time.perf_counter()
+                logger.info(
+                    'measure#django.request=%.1fms request_id=%s status=%d',
+                    12.5, i, 200,
+                    extra={'timings': {'total': 0.0125}, 'status': 200}
+                )
+                local.append(time.perf_counter() - start)
+            timings.extend(local)
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        logger.removeHandler(handler)
+        timings.sort()
+        self.stdout.write(
+            '%s: %.1fus mean, %.1fus p99 per request, %.0f requests/s,'
+            ' %d dropped' % (
+                name, sum(timings) / len(timings) * 1e6,
+                timings[int(len(timings) * 0.99)] * 1e6,
+                len(timings) / elapsed, getattr(handler, 'dropped', 0),
+            )
+        )
@@ -0,0 +1,66 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.pagination import Cursor, LimitOffsetPagination
+from rest_framework.request import Request
+
+from ...pagination import CursorPagination
+
+
+class Command(BaseCommand):
+    help = 'Compare the cost of deep pages with cursor and offset pagination.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000)
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--depths', type=int, nargs='+',
+                            default=[0, 1000, 10000, 45000],
+                            help='Rows to skip before the page.')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        # The rows are only ever seen inside this transaction.
+        with transaction.atomic():
+            User.objects.bulk_create(
+                User(username='benchpagination%d' % i)
+                for i in range(options['rows'])
+            )
+            queryset = User.objects.all()
+            for depth in options['depths']:
+                offset = self.run(self.offset_page, queryset, depth, options)
+                cursor = self.run(self.cursor_page, queryset, depth, options)
+                self.stdout.write(
+                    'depth %d: %.2fms offset, %.2fms cursor per page' % (
+                        depth, offset * 1000, cursor * 1000
+                    )
+                )
+            transaction.set_rollback(True)
+
+    def run(self, page, queryset, depth, options):
+        paginator, request = page(queryset, depth, options['page_size'])
+        start = time.perf_counter()
+        for i in range(options['repeat']):
+            paginator.paginate_queryset(queryset, request)
+        return (time.perf_counter() - start) / options['repeat']
+
+    def offset_page(self, queryset, depth, size):
+        paginator = LimitOffsetPagination()
+        request = Request(RequestFactory().get('/', {
+            'limit': size, 'offset': depth,
+        }))
+        return paginator, request
+
+    def cursor_page(self, queryset, depth, size):
+        paginator = CursorPagination()
+        paginator.page_size = size
+        paginator.base_url = 'http://testserver/'
+        url = paginator.base_url
+        if depth:
+            position = queryset.order_by(paginator.ordering).values_list(
+                'pk', flat=True
+            )[depth - 1]
+            url = paginator.encode_cursor(Cursor(0, False, str(position)))
+        return paginator, Request(RequestFactory().get(url))
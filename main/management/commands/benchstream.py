@@ -0,0 +1,101 @@
+import gc
+import threading
+import time
+
+import psutil
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework import viewsets
+from rest_framework_json_api import serializers
+
+from ...renderers import JSONRenderer, StreamingJSONRenderer
+from ...viewsets import StreamingListMixin
+
+
+class UserSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = User
+        fields = ('username', 'email', 'first_name', 'last_name', 'date_joined')
+
+
+class UserViewSet(StreamingListMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = User.objects.order_by('pk')
+    serializer_class = UserSerializer
+    resource_name = 'users'
+    pagination_class = None
+    authentication_classes = ()
+    permission_classes = ()
+
+
+class PeakRSS(object):
+    """ Track the process' peak resident set size above where it started.
+
+    RSS is sampled every `interval` seconds by a thread, since the
+    kernel's high water mark can't be reset between runs.
+    """
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+
+    def __enter__(self):
+        self.start = self.process.memory_info().rss
+        self.peak = self.start
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.done.set()
+        self.thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def sample(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+    @property
+    def growth(self):
+        return self.peak - self.start
+
+
+class Command(BaseCommand):
+    help = 'Compare the peak memory of buffered and streamed list responses.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        # The rows are only ever seen inside this transaction.
+        with transaction.atomic():
+            User.objects.bulk_create(
+                User(username='benchstream%d' % i, email='benchstream%d@example.com' % i)
+                for i in range(options['rows'])
+            )
+            for renderer in (StreamingJSONRenderer, JSONRenderer):
+                self.run(renderer)
+            transaction.set_rollback(True)
+
+    def run(self, renderer):
+        view = UserViewSet.as_view({'get': 'list'}, renderer_classes=(renderer,))
+        gc.collect()
+        size = 0
+        start = time.perf_counter()
+        with PeakRSS() as rss:
+            response = view(RequestFactory().get('/'))
+            if response.streaming:
+                for part in response.streaming_content:
+                    size += len(part)
+            else:
+                size = len(response.render().content)
+            del response
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            '%s: %.1fMB peak RSS growth, %.1fMB response, %.2fs' % (
+                renderer.__name__, rss.growth / 2 ** 20, size / 2 ** 20, elapsed
+            )
+        )
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.staticfiles.management.commands import collectstatic
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import get_storage_class
+
+from ...storage import CompressedManifestStorage
+
+
+HASHES_NAME = 'staticfiles-hashes.json'
+
+
+class Command(collectstatic.Command):
+    """ Collect static files, optionally syncing only what changed.
+
+    With `--incremental`, files are collected and post-processed into
+    STATIC_ROOT first. Their content hashes are then compared with the
+    ones recorded in the static storage by the last sync, and only new
+    or changed files are uploaded, in parallel. The manifest goes last,
+    so pages never reference files that aren't there yet.
+    """
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Collect locally, then upload only changed files.'
+        )
+        parser.add_argument(
+            '--jobs', type=int, default=8,
+            help='Number of parallel uploads with --incremental.'
+        )
+        parser.add_argument(
+            '--delete-stale', action='store_true',
+            help='Delete files no longer collected with --incremental.'
+        )
+
+    def handle(self, **options):
+        if not options['incremental']:
+            return super().handle(**options)
+        remote = self.storage
+        self.storage = CompressedManifestStorage(location=settings.STATIC_ROOT)
+        try:
+            result = super().handle(**options)
+        finally:
+            self.storage = remote
+        if not options['dry_run']:
+            self.sync(options['jobs'], options['delete_stale'])
+        return result
+
+    def sync(self, jobs, delete_stale):
+        start = time.time()
+        root = settings.STATIC_ROOT
+        hashes = {}
+        for dirpath, dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                if name != HASHES_NAME:
+                    hashes[name] = file_hash(path)
+        with open(os.path.join(root, HASHES_NAME), 'w') as file:
+            json.dump(hashes, file, sort_keys=True)
+
+        # Files are already compressed locally.
+        storage_class = get_storage_class(settings.STATICFILES_STORAGE)
+        remote = storage_class()
+        remote.precompress = False
+
+        remote_hashes = self.remote_hashes(remote)
+        changed = sorted(n for n, h in hashes.items() if remote_hashes.get(n) != h)
+        stale = sorted(n for n in remote_hashes if n not in hashes)
+
+        # The manifest names the hashed files, so it must follow them.
+        manifest = getattr(remote, 'manifest_name', None)
+        last = [n for n in changed if n == manifest]
+        changed = [n for n in changed if n != manifest]
+
+        local = threading.local()
+
+        def upload(name):
+            # Storages aren't safe to share between threads.
+            if not hasattr(local, 'storage'):
+                local.storage = storage_class()
+                local.storage.precompress = False
+            path = os.path.join(root, name)
+            with open(path, 'rb') as file:
+                local.storage.save(name, File(file))
+            self.log('Uploaded %s' % name, level=2)
+            return os.path.getsize(path)
+
+        with ThreadPoolExecutor(jobs) as pool:
+            sizes = list(pool.map(upload, changed))
+        sizes.extend(upload(name) for name in last)
+        remote.save(HASHES_NAME, ContentFile(json.dumps(hashes).encode()))
+
+        if delete_stale and stale:
+            if hasattr(remote, 'delete_many'):
+                remote.delete_many(stale)
+            else:
+                for name in stale:
+                    remote.delete(name)
+
+        elapsed = max(time.time() - start, 1e-6)
+        self.stdout.write(
+            '%d of %d files uploaded (%.1f files/s, %.1f MB/s), %d stale %s.' % (
+                len(sizes), len(hashes), len(sizes) / elapsed,
+                sum(sizes) / elapsed / 1024 / 1024, len(stale),
+                'deleted' if delete_stale else 'kept'
+            )
+        )
+
+    def remote_hashes(self, remote):
+        if not remote.exists(HASHES_NAME):
+            return {}
+        with remote.open(HASHES_NAME) as file:
+            return json.loads(file.read().decode())
+
+
+def file_hash(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(64 * 1024), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
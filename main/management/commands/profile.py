@@ -0,0 +1,35 @@
+import os
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...profiler import request_path
+
+
+class Command(BaseCommand):
+    help = 'Profile a running daphne or worker process for a while.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pid', type=int)
+        parser.add_argument('--seconds', type=float, default=30)
+
+    def handle(self, *args, **options):
+        # Without the profiler's handler, SIGUSR2 would kill the process.
+        if not settings.PROFILER_ENABLED:
+            raise CommandError('The profiler is off; set PROFILER=true and restart first.')
+        if not options['seconds'] > 0:
+            raise CommandError('--seconds must be positive.')
+        pid = options['pid']
+        with open(request_path(pid), 'w') as request:
+            request.write(str(options['seconds']))
+        try:
+            os.kill(pid, signal.SIGUSR2)
+        except OSError as exc:
+            os.remove(request_path(pid))
+            raise CommandError('Unable to signal %d: %s' % (pid, exc))
+        self.stdout.write(
+            'Profiling %d for %ss; the result is saved under profiles/.' % (
+                pid, options['seconds']
+            )
+        )
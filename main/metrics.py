@@ -0,0 +1,257 @@
+""" Per-view request timing.
+
+Timings are split into phases: `db`, `cache` and `render` are measured
+directly, `serialization` is time in `serializer.data` less the
+database and cache time spent inside it, `other` is what remains of
+the request once those are taken out (view code and middleware), and
+`total` covers the whole request. Each (view, phase) pair feeds a
+histogram kept in this process, exported by the `metrics` view in the
+Prometheus text format, along with the counters kept by the cache,
+the Redis pools, database connections and task queue lanes.
+"""
+import threading
+import time
+from functools import wraps
+
+from django.db import connections
+
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PHASES = ('total', 'db', 'cache', 'serialization', 'render', 'other')
+
+_histograms = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class Histogram(object):
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class timed(object):
+    """ Add the time spent in a block to a phase of the current request.
+
+    Works as a context manager or as a function decorator.
+    """
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(self.phase):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        self.start = time.monotonic()
+
+    def __exit__(self, *exc):
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            timings[self.phase] += time.monotonic() - self.start
+
+
+class timed_serialization(object):
+    """ Add the time spent in a block to the serialization phase.
+
+    Database and cache time inside the block already count towards
+    their own phases, so it's left out.
+    """
+    def __enter__(self):
+        self.timings = getattr(_local, 'timings', None)
+        if self.timings is not None:
+            self.cache = self.timings['cache']
+            self.queries = {
+                connection.alias: len(connection.queries_log)
+                for connection in connections.all()
+            }
+            self.start = time.monotonic()
+
+    def __exit__(self, *exc):
+        if self.timings is None:
+            return
+        elapsed = time.monotonic() - self.start
+        elapsed -= self.timings['cache'] - self.cache
+        for connection in connections.all():
+            before = self.queries.get(connection.alias, len(connection.queries_log))
+            elapsed -= query_time(connection, before)
+        self.timings['serialization'] += max(elapsed, 0.0)
+
+
+def query_time(connection, before):
+    """ Time spent in the queries logged on `connection` after the first
+    `before`.
+    """
+    return sum(float(q['time']) for q in list(connection.queries_log)[before:])
+
+
+def current():
+    """ Request id and view of the request this thread is handling.
+    """
+    return getattr(_local, 'request_id', None), getattr(_local, 'view', None)
+
+
+def start_request(request_id):
+    _local.request_id = request_id
+    _local.view = None
+    _local.timings = dict.fromkeys(PHASES, 0.0)
+    _local.queries = {}
+    for connection in connections.all():
+        _local.queries[connection.alias] = (
+            connection.force_debug_cursor, len(connection.queries_log)
+        )
+        connection.force_debug_cursor = True
+
+
+def set_view(view):
+    _local.view = view
+
+
+def restore_cursors():
+    """ Put back the debug cursor settings changed by `start_request`.
+
+    Returns the time spent in database queries since then.
+    """
+    queries = getattr(_local, 'queries', None) or {}
+    elapsed = 0.0
+    for connection in connections.all():
+        if connection.alias not in queries:
+            continue
+        debug, before = queries[connection.alias]
+        connection.force_debug_cursor = debug
+        elapsed += query_time(connection, before)
+    _local.queries = None
+    return elapsed
+
+
+def finish_request(total):
+    """ Record the current request and return its timings.
+    """
+    timings = _local.timings
+    timings['db'] += restore_cursors()
+    timings['total'] = total
+    timings['other'] = max(total - sum(
+        timings[p] for p in ('db', 'cache', 'serialization', 'render')
+    ), 0.0)
+    view = _local.view or 'unresolved'
+    with _lock:
+        for phase, value in timings.items():
+            key = (view, phase)
+            if key not in _histograms:
+                _histograms[key] = Histogram()
+            _histograms[key].observe(value)
+    _local.timings = None
+    return timings
+
+
+def end_request():
+    """ Forget the current request, whether or not it was recorded.
+    """
+    restore_cursors()
+    _local.request_id = None
+    _local.view = None
+    _local.timings = None
+
+
+def render_prometheus():
+    lines = [
+        '# HELP request_duration_seconds Request time by view and phase.',
+        '# TYPE request_duration_seconds histogram',
+    ]
+    with _lock:
+        items = sorted(_histograms.items())
+        for (view, phase), histogram in items:
+            labels = 'view="%s",phase="%s"' % (view, phase)
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append('request_duration_seconds_bucket{%s,le="%s"} %d' % (
+                    labels, bound, cumulative
+                ))
+            lines.append('request_duration_seconds_bucket{%s,le="+Inf"} %d' % (
+                labels, histogram.count
+            ))
+            lines.append('request_duration_seconds_sum{%s} %f' % (labels, histogram.sum))
+            lines.append('request_duration_seconds_count{%s} %d' % (labels, histogram.count))
+    return '\n'.join(lines) + '\n'
+
+
+def render_stats():
+    """ Counters kept elsewhere in this process, in Prometheus format.
+    """
+    from channels import channel_layers
+    from django.conf import settings
+    from django.core.cache import caches
+    from .db import connection_stats
+    from .pool import wait_stats
+
+    lines = []
+
+    def metric(name, kind, doc, samples):
+        lines.append('# HELP %s %s' % (name, doc))
+        lines.append('# TYPE %s %s' % (name, kind))
+        for labels, value in samples:
+            labels = ','.join('%s="%s"' % item for item in labels)
+            lines.append('%s%s %s' % (name, '{%s}' % labels if labels else '', value))
+
+    waits = wait_stats()
+    metric('redis_pool_waits_total', 'counter', 'Redis connection checkouts.',
+           [((), waits['count'])])
+    metric('redis_pool_wait_seconds_total', 'counter',
+           'Time spent waiting for Redis connections.', [((), waits['total'])])
+    metric('redis_pool_wait_seconds_max', 'gauge',
+           'Longest wait for a Redis connection.', [((), waits['max'])])
+    metric('redis_pool_slow_waits_total', 'counter',
+           'Redis connection waits over the warning threshold.',
+           [((), waits['slow'])])
+    metric('redis_pool_timeouts_total', 'counter',
+           'Redis connection waits that timed out.', [((), waits['timeouts'])])
+    metric('redis_pool_size', 'gauge', 'Redis connections allowed.',
+           [((), waits['size'])])
+
+    local = [
+        (alias, caches[alias].stats()) for alias in settings.CACHES
+        if hasattr(caches[alias], 'stats')
+    ]
+    for key, kind in (('hits', 'counter'), ('misses', 'counter'),
+                      ('evictions', 'counter'), ('size', 'gauge')):
+        metric('cache_local_%s%s' % (key, '_total' if kind == 'counter' else ''),
+               kind, 'Local cache tier %s.' % key,
+               [((('cache', alias),), stats[key]) for alias, stats in local])
+
+    for key in ('opened', 'unusable'):
+        metric('db_connections_%s_total' % key, 'counter',
+               'Database connections %s.' % key,
+               [((('alias', a),), n) for a, n in sorted(connection_stats[key].items())])
+
+    lanes = []
+    for alias in settings.CHANNEL_LAYERS:
+        layer = channel_layers[alias].channel_layer
+        if hasattr(layer, 'lane_stats'):
+            lanes.extend(layer.lane_stats().items())
+    for key, name, kind, doc in (
+            ('sent', 'sent_total', 'counter', 'Tasks sent.'),
+            ('full', 'full_total', 'counter', 'Tasks refused by a full lane.'),
+            ('received', 'received_total', 'counter', 'Tasks received.'),
+            ('wait_total', 'wait_seconds_total', 'counter', 'Time tasks spent queued.'),
+            ('wait_max', 'wait_seconds_max', 'gauge', 'Longest time a task spent queued.'),
+            ('depth', 'depth', 'gauge', 'Tasks waiting.')):
+        metric('task_lane_' + name, kind, doc, [
+            ((('lane', lane),), stats[key]) for lane, stats in lanes
+            if stats[key] is not None
+        ])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,89 @@
+import logging
+import time
+import uuid
+
+from django.conf import settings
+
+from . import metrics
+from .cache import CacheBatch
+from .db import is_sticky, make_sticky, use_replicas
+
+
+logger = logging.getLogger(__name__)
+
+
+class TimingMiddleware(object):
+    """ Time each request by phase and log it in l2met format.
+
+    The request id is taken from `X-Request-Id`, as logged by nginx,
+    or generated, and is echoed on the response.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = request.META.get('HTTP_X_REQUEST_ID') or uuid.uuid4().hex
+        metrics.start_request(request_id)
+        start = time.monotonic()
+        try:
+            response = self.get_response(request)
+            timings = metrics.finish_request(time.monotonic() - start)
+            logger.info(
+                'measure#django.request=%.1fms measure#django.db=%.1fms'
+                ' measure#django.cache=%.1fms measure#django.serialization=%.1fms'
+                ' measure#django.render=%.1fms measure#django.other=%.1fms'
+                ' request_id=%s view=%s status=%d',
+                *[timings[p] * 1000 for p in metrics.PHASES],
+                request_id, metrics.current()[1] or 'unresolved', response.status_code,
+                extra={'timings': timings, 'status': response.status_code}
+            )
+        finally:
+            metrics.end_request()
+        response['X-Request-Id'] = request_id
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        metrics.set_view(match.view_name or match.url_name or view_func.__name__)
+
+
+class CacheBatchMiddleware(object):
+    """ Attach a `CacheBatch` to each request and flush it afterwards.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.cache_batch = CacheBatch()
+        response = self.get_response(request)
+        request.cache_batch.flush()
+        return response
+
+
+class ReplicaMiddleware(object):
+    """ Serve safe requests from read replicas.
+
+    GET, HEAD and OPTIONS requests read from a replica unless the session
+    wrote something within the last `REPLICA_STICKY_SECONDS`.
+    """
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in self.safe_methods
+        session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        use_replicas(safe and not is_sticky(session_key))
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replicas(False)
+        if not safe:
+
+            # Logging in cycles the session key, so take it afresh.
+            session = getattr(request, 'session', None)
+            session_key = getattr(session, 'session_key', None) or session_key
+            if session_key:
+                make_sticky(session_key)
+        return response
@@ -0,0 +1,60 @@
+import hashlib
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from rest_framework.pagination import CursorPagination as BaseCursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param
+
+
+class CursorPagination(BaseCursorPagination):
+    """ Keyset pagination in the JSON:API response format.
+
+    Pages are located by filtering on the ordering field rather than by
+    offset, so deep pages cost the same as the first. Clients page with
+    `page[cursor]` and `page[size]`. The total count is only computed
+    when asked for with `page[count]`, and is cached for
+    `count_timeout` seconds.
+    """
+    cursor_query_param = 'page[cursor]'
+    page_size_query_param = 'page[size]'
+    count_query_param = 'page[count]'
+    max_page_size = 100
+    ordering = '-pk'
+    count_timeout = 60
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param):
+            self.count = self.get_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count(self, queryset):
+        try:
+            sql = str(queryset.query)
+        except EmptyResultSet:
+            return 0
+        key = 'pagination:count:%s' % hashlib.md5(sql.encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, self.count_timeout)
+        return count
+
+    def get_first_link(self):
+        url = self.request.build_absolute_uri()
+        return remove_query_param(url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([('results', data)])
+        if self.count is not None:
+            response['meta'] = {
+                'pagination': OrderedDict([('count', self.count)]),
+            }
+        response['links'] = OrderedDict([
+            ('first', self.get_first_link()),
+            ('next', self.get_next_link()),
+            ('prev', self.get_previous_link()),
+        ])
+        return Response(response)
@@ -0,0 +1,27 @@
+from django.conf import settings
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+from rest_framework_json_api import parsers as jsonapi_parsers
+
+from . import encoding
+
+
+class FastJSONParserMixin(parsers.JSONParser):
+    """ Decode request bodies with the fast JSON backend.
+
+    Sits after the JSON:API parser in the MRO, replacing only the
+    decoding step it delegates to DRF.
+    """
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        charset = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if encoding.orjson is None or charset.lower() not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return encoding.loads(stream.read())
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % exc)
+
+
+class JSONParser(jsonapi_parsers.JSONParser, FastJSONParserMixin):
+    pass
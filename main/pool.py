@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+import weakref
+
+import redis
+from django.conf import settings
+from redis.connection import BlockingConnectionPool
+from redis.exceptions import ConnectionError
+from redis_channel_layer import DjangoRedisChannelLayer
+
+
+logger = logging.getLogger(__name__)
+
+_pools = weakref.WeakSet()
+
+
+class MeteredBlockingConnectionPool(BlockingConnectionPool):
+    """ Blocking pool that records how long callers wait for a connection,
+    and how often they give up waiting.
+
+    `warn_wait` is the wait, in seconds, above which a warning is
+    logged. Pass it through `CONNECTION_POOL_KWARGS`.
+    """
+    def __init__(self, *args, warn_wait=0.1, **kwargs):
+        self.warn_wait = warn_wait
+        self._stats_lock = threading.Lock()
+        self.reset_wait_stats()
+        super().__init__(*args, **kwargs)
+        _pools.add(self)
+
+    def reset_wait_stats(self):
+        with self._stats_lock:
+            self.wait_count = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.wait_slow = 0
+            self.wait_timeouts = 0
+
+    def get_connection(self, *args, **kwargs):
+        start = time.monotonic()
+        try:
+            return super().get_connection(*args, **kwargs)
+        except ConnectionError:
+            wait = time.monotonic() - start
+            if self.timeout is not None and wait >= self.timeout:
+                with self._stats_lock:
+                    self.wait_timeouts += 1
+                logger.error(
+                    'No Redis connection available after %.1fs (pool size %d).',
+                    wait, self.max_connections
+                )
+            raise
+        finally:
+            self._record_wait(time.monotonic() - start)
+
+    def wait_stats(self):
+        with self._stats_lock:
+            return {
+                'count': self.wait_count,
+                'total': self.wait_total,
+                'max': self.wait_max,
+                'slow': self.wait_slow,
+                'timeouts': self.wait_timeouts,
+                'size': self.max_connections,
+            }
+
+    def _record_wait(self, wait):
+        with self._stats_lock:
+            self.wait_count += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            if wait > self.warn_wait:
+                self.wait_slow += 1
+        if wait > self.warn_wait:
+            logger.warning(
+                'Waited %.3fs for a Redis connection (pool size %d).',
+                wait, self.max_connections
+            )
+
+
+def wait_stats():
+    """ Connection wait statistics summed over this process' pools.
+    """
+    totals = {
+        'count': 0, 'total': 0.0, 'max': 0.0, 'slow': 0, 'timeouts': 0, 'size': 0,
+    }
+    for pool in list(_pools):
+        stats = pool.wait_stats()
+        for key in ('count', 'total', 'slow', 'timeouts', 'size'):
+            totals[key] += stats[key]
+        totals['max'] = max(totals['max'], stats['max'])
+    return totals
+
+
+def cache_pool(url):
+    """ Connection pool of the Redis cache at `url`, if there is one.
+    """
+    from django.core.cache import caches
+    for alias, config in settings.CACHES.items():
+        if config.get('LOCATION') != url:
+            continue
+        client = getattr(caches[alias], 'client', None)
+        if hasattr(client, 'get_client'):
+            return client.get_client(write=True).connection_pool
+    return None
+
+
+class SharedPoolMixin(object):
+    """ Channel layer connecting through the cache's connection pool.
+
+    Hosts shared with a django_redis cache use that cache's pool, so
+    each process keeps one, metered, pool per Redis server.
+    """
+    def _generate_connections(self):
+        connections = []
+        for host in self.hosts:
+            pool = cache_pool(host)
+            if pool is None:
+                connections.append(redis.Redis.from_url(host))
+            else:
+                connections.append(redis.Redis(connection_pool=pool))
+        return connections
+
+
+class SharedPoolChannelLayer(SharedPoolMixin, DjangoRedisChannelLayer):
+    pass
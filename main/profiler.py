@@ -0,0 +1,111 @@
+""" Sampling profiler for live processes.
+
+Samples the stack of every thread in the process at a fixed interval
+for a number of seconds, then saves the counts in the folded format
+used by flamegraph.pl and speedscope to the default storage, under
+`profiles/`. Sampling happens in its own thread, so it can be started
+from a request, or from a signal sent by `manage.py profile`.
+"""
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_active = None
+
+
+def request_path(pid):
+    """ File `manage.py profile` leaves the sample duration in.
+    """
+    return os.path.join(tempfile.gettempdir(), 'main-profile-%d' % pid)
+
+
+def profile_name():
+    return 'profiles/%s-%d-%s.folded' % (
+        socket.gethostname(), os.getpid(), time.strftime('%Y%m%d%H%M%S')
+    )
+
+
+def start_profile(seconds):
+    """ Start sampling this process, returning the name it will be saved
+    under, or None if a profile is already running.
+    """
+    global _active
+    seconds = min(float(seconds), settings.PROFILER_MAX_SECONDS)
+    with _lock:
+        if _active is not None and _active.is_alive():
+            return None
+        _active = Sampler(seconds, settings.PROFILER_INTERVAL, profile_name())
+        _active.start()
+        return _active.name_hint
+
+
+def handle_signal(signum, frame):
+    try:
+        with open(request_path(os.getpid())) as request:
+            seconds = float(request.read().strip())
+        os.remove(request_path(os.getpid()))
+    except (IOError, ValueError):
+        seconds = 30
+    start_profile(seconds)
+
+
+def install_signal_handler():
+    """ Let `manage.py profile` start the profiler in this process.
+
+    Signal handlers can only be set from the main thread; elsewhere
+    this does nothing.
+    """
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR2, handle_signal)
+
+
+class Sampler(threading.Thread):
+
+    def __init__(self, seconds, interval, name_hint):
+        super().__init__(name='profiler', daemon=True)
+        self.seconds = seconds
+        self.interval = interval
+        self.name_hint = name_hint
+
+    def run(self):
+        counts = Counter()
+        own = threading.get_ident()
+        end = time.monotonic() + self.seconds
+        while time.monotonic() < end:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    counts[self.stack(frame, names.get(ident, ident))] += 1
+            time.sleep(self.interval)
+        content = ''.join('%s %d\n' % item for item in counts.items())
+        try:
+            name = default_storage.save(self.name_hint, ContentFile(content.encode()))
+        except Exception:
+            logger.exception('Unable to save profile.')
+        else:
+            logger.info('Saved profile to %s.', name)
+
+    def stack(self, frame, thread_name):
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append('%s (%s:%d)' % (
+                code.co_name, code.co_filename, code.co_firstlineno
+            ))
+            frame = frame.f_back
+        parts.append('thread %s' % thread_name)
+        return ';'.join(reversed(parts))
@@ -0,0 +1,98 @@
+from itertools import islice
+
+from rest_framework import renderers
+from rest_framework_json_api import renderers as jsonapi_renderers
+
+from .encoding import dumps
+from .metrics import timed
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+class DocumentRenderer(renderers.JSONRenderer):
+    """ Return the JSON:API document itself instead of encoding it.
+
+    Placed after the JSON:API renderer in the MRO, this intercepts the
+    final encoding step so documents can be assembled piecewise.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class FastJSONRendererMixin(renderers.JSONRenderer):
+    """ Encode responses with the fast JSON backend.
+
+    Sits after the JSON:API renderer in the MRO, replacing only the
+    encoding step it delegates to DRF. Indented and ASCII-only output
+    is left to DRF.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Escape the line and paragraph separators, as DRF does, so the
+        # output is also valid JavaScript.
+        return dumps(data).replace(
+            b'\xe2\x80\xa8', b'\\u2028'
+        ).replace(
+            b'\xe2\x80\xa9', b'\\u2029'
+        )
+
+
+class JSONRenderer(jsonapi_renderers.JSONRenderer, FastJSONRendererMixin):
+
+    @timed('render')
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class ChunkRenderer(jsonapi_renderers.JSONRenderer, DocumentRenderer):
+    pass
+
+
+class StreamingJSONRenderer(JSONRenderer):
+    """ JSON:API renderer able to stream list responses.
+
+    Used directly it behaves like the regular JSON:API renderer. Views
+    using `main.viewsets.StreamingListMixin` call `render_stream`
+    instead, which serializes and writes `chunk_size` objects at a time.
+    Included resources are de-duplicated and written after `data`.
+    """
+    chunk_size = 500
+
+    def render_stream(self, objects, get_serializer, renderer_context,
+                      meta=None, links=None):
+        document_renderer = ChunkRenderer()
+        seen = set()
+        included = []
+        separator = b''
+        yield b'{"data":['
+        for chunk in chunked(objects, self.chunk_size):
+            document = document_renderer.render(
+                get_serializer(chunk).data, self.media_type, renderer_context
+            )
+            for resource in document.get('data', []):
+                yield separator + dumps(resource)
+                separator = b','
+            for resource in document.get('included', []):
+                key = (resource['type'], resource['id'])
+                if key not in seen:
+                    seen.add(key)
+                    included.append(resource)
+        yield b']'
+        if included:
+            yield b',"included":[' + b','.join(map(dumps, included)) + b']'
+        if meta:
+            yield b',"meta":' + dumps(meta)
+        if links:
+            yield b',"links":' + dumps(links)
+        yield b'}'
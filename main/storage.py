@@ -0,0 +1,108 @@
+""" Static file storages for long-lived caching.
+
+Both storages write content-hashed names alongside a manifest, so any
+hashed file can be cached forever, and save gzip (and brotli, when the
+`brotli` package is installed) copies of compressible files next to the
+original as `<name>.gz` and `<name>.br`.
+"""
+import gzip
+import mimetypes
+import re
+
+from django.contrib.staticfiles.storage import (
+    ManifestFilesMixin, ManifestStaticFilesStorage
+)
+from django.core.files.base import ContentFile
+from storages.backends.s3boto import S3BotoStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+ENCODINGS = {'.gz': 'gzip', '.br': 'br'}
+
+
+class PrecompressMixin(object):
+    """ Save compressed copies of each compressible file.
+
+    Copies that don't come out smaller are skipped.
+    """
+    compress_extensions = (
+        '.css', '.js', '.json', '.map', '.svg', '.html', '.txt', '.xml',
+        '.ico', '.eot', '.otf', '.ttf',
+    )
+    compress_min_size = 256
+    precompress = True
+
+    def _save(self, name, content):
+        data = None
+        if (self.precompress and name.endswith(self.compress_extensions) and
+                name != self.manifest_name):
+            content.seek(0)
+            data = content.read()
+            content.seek(0)
+        name = super()._save(name, content)
+        if data is not None and len(data) >= self.compress_min_size:
+            if isinstance(data, str):
+                data = data.encode()
+            for suffix, compressed in self.compress(data):
+                if len(compressed) < len(data):
+                    self.delete(name + suffix)
+                    self._save(name + suffix, ContentFile(compressed))
+        return name
+
+    def compress(self, data):
+        yield '.gz', gzip.compress(data, 9)
+        if brotli is not None:
+            yield '.br', brotli.compress(data)
+
+
+class CompressedManifestStorage(PrecompressMixin, ManifestStaticFilesStorage):
+    """ Local static storage, for nginx to serve with `gzip_static`.
+    """
+
+
+class S3ManifestStorage(PrecompressMixin, ManifestFilesMixin, S3BotoStorage):
+    """ S3 static storage with far-future caching of hashed files.
+
+    Compressed copies are uploaded with the content type of the
+    original and a matching `Content-Encoding`. The manifest is never
+    cached, so a deploy takes effect immediately.
+    """
+    def _save(self, name, content):
+        if name.endswith(tuple(ENCODINGS)):
+            content.content_type = self.guess_type(name[:-3])
+        return super()._save(name, content)
+
+    def _save_content(self, key, content, headers):
+        # `headers` are this upload's own copy and `content.name` is the
+        # name being saved, relative to the storage's location.
+        name = content.name
+        if name.endswith(tuple(ENCODINGS)):
+            name, suffix = name[:-3], name[-3:]
+            headers['Content-Encoding'] = ENCODINGS[suffix]
+        headers.update(self.upload_headers(name))
+        super()._save_content(key, content, headers)
+
+    def delete_many(self, names):
+        """ Delete files a thousand at a time.
+        """
+        names = [self._normalize_name(self._clean_name(n)) for n in names]
+        for start in range(0, len(names), 1000):
+            self.bucket.delete_keys(names[start:start + 1000], quiet=True)
+
+    def upload_headers(self, name):
+        if name == self.manifest_name:
+            return {'Cache-Control': 'no-cache'}
+        if HASHED_NAME.search(name):
+            return {'Cache-Control': IMMUTABLE}
+        return {'Cache-Control': 'public, max-age=300'}
+
+    def guess_type(self, name):
+        return mimetypes.guess_type(name)[0] or 'application/octet-stream'
@@ -0,0 +1,31 @@
+import logging
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class SilentMixin(object):
+    """ Hide logging output in tests.
+    """
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        super().setUp()
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        super().tearDown()
+
+
+class QueryCountMixin(object):
+    """ Assert on the number of queries a block of code runs.
+    """
+    @contextmanager
+    def assertMaxQueries(self, num, using=DEFAULT_DB_ALIAS):
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        if len(context) > num:
+            queries = '\n'.join(q['sql'] for q in context.captured_queries)
+            self.fail('%d queries executed, at most %d expected:\n%s' % (
+                len(context), num, queries
+            ))
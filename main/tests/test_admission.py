@@ -0,0 +1,298 @@
+import threading
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase
+from redis_channel_layer import DjangoRedisChannelLayer
+from twisted.internet import defer
+from twisted.internet.task import Clock
+
+from . import SilentMixin
+from ..admission import AdmissionControl
+from ..lanes import channel_depth
+
+
+CONFIG = {
+    'max_in_flight': 4,
+    'max_fill': 0.8,
+    'priority_max_fill': 0.95,
+    'priority_factor': 2,
+    'retry_after': 5,
+    'exempt_paths': ['/health/'],
+    'priority_paths': ['/api/'],
+    'timeout': 120,
+}
+
+SESSION = [(b'cookie', b'%s=abc' % settings.SESSION_COOKIE_NAME.encode())]
+
+
+def request(reply_channel, path='/', headers=()):
+    return {'reply_channel': reply_channel, 'path': path, 'headers': list(headers)}
+
+
+def make_layer(fill=0.0):
+    layer = mock.Mock()
+    layer.get_capacity.return_value = 100
+    layer.connection.return_value.llen.return_value = int(fill * 100)
+    layer.prefix = 'test:'
+    return layer
+
+
+class AdmissionControlTestCase(SilentMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.layer = make_layer()
+        self.admission = AdmissionControl(self.layer, **CONFIG)
+
+    def send(self, count, path='/', headers=(), start=0):
+        for i in range(start, start + count):
+            self.admission.send('http.request', request('reply!%d' % i, path, headers))
+
+    def assertRejected(self, reply_channel):
+        channel, message = self.admission.receive([reply_channel])
+        self.assertEqual(channel, reply_channel)
+        self.assertEqual(message['status'], 503)
+        self.assertIn((b'Retry-After', b'5'), message['headers'])
+
+    def test_admits_up_to_limit(self):
+        self.send(5)
+        self.assertEqual(self.layer.send.call_count, 4)
+        self.assertEqual(len(self.admission.in_flight), 4)
+        self.assertEqual(self.admission.shed, 1)
+        self.assertRejected('reply!4')
+
+    def test_rejection_received_before_layer(self):
+        self.send(5)
+        self.layer.receive.reset_mock()
+        self.assertRejected('reply!4')
+        self.layer.receive.assert_not_called()
+        self.admission.receive(['reply!4'])
+        self.layer.receive.assert_called_once_with(['reply!4'], block=False)
+
+    def test_exempt_paths(self):
+        self.send(4)
+        self.send(10, path='/health/', start=4)
+        self.assertEqual(self.layer.send.call_count, 14)
+        self.assertEqual(self.admission.shed, 0)
+
+    def test_priority_paths(self):
+        self.send(10, path='/api/users', headers=SESSION)
+        self.assertEqual(self.layer.send.call_count, 8)
+
+    def test_priority_needs_session(self):
+        self.send(10, path='/api/users')
+        self.assertEqual(self.layer.send.call_count, 4)
+
+    def test_fill_level(self):
+        self.layer.connection.return_value.llen.return_value = 90
+        self.send(1)
+        self.send(1, path='/api/users', headers=SESSION, start=1)
+        self.assertEqual(self.admission.shed, 1)
+        self.assertRejected('reply!0')
+
+    def test_fill_level_read_once_a_second(self):
+        with mock.patch('main.admission.time.monotonic', side_effect=[10.0, 10.5, 11.0]):
+            self.send(3)
+        self.assertEqual(self.layer.get_capacity.call_count, 2)
+
+    def test_response_frees_slot(self):
+        self.send(4)
+        self.layer.receive.return_value = ('reply!0', {'status': 200, 'more_content': True})
+        self.admission.receive(['reply!0'])
+        self.assertIn('reply!0', self.admission.in_flight)
+        self.layer.receive.return_value = ('reply!0', {'content': b''})
+        self.admission.receive(['reply!0'])
+        self.assertNotIn('reply!0', self.admission.in_flight)
+        self.send(1, start=4)
+        self.assertEqual(self.admission.shed, 0)
+
+    def test_disconnect_frees_slot(self):
+        self.send(5)
+        for i in (0, 4):
+            self.admission.send('http.disconnect', {'reply_channel': 'reply!%d' % i})
+        self.assertNotIn('reply!0', self.admission.in_flight)
+        self.assertEqual(self.admission.rejected, {})
+        self.assertEqual(self.layer.send.call_args[0][0], 'http.disconnect')
+
+    def test_timed_out_requests_expire(self):
+        with mock.patch('main.admission.time.monotonic', return_value=0.0):
+            self.send(4)
+        with mock.patch('main.admission.time.monotonic', return_value=121.0):
+            self.send(1, start=4)
+        self.assertEqual(list(self.admission.in_flight), ['reply!4'])
+
+    def test_other_channels_passed_through(self):
+        self.admission.send('websocket.receive', {'reply_channel': 'reply!0'})
+        self.layer.send.assert_called_once_with('websocket.receive', {'reply_channel': 'reply!0'})
+        self.assertEqual(self.admission.in_flight, {})
+
+    def test_keeps_twisted_extension(self):
+        self.layer.extensions = ['groups', 'flush', 'twisted']
+        self.assertIn('twisted', self.admission.extensions)
+
+
+class ReceiveTwistedTestCase(SilentMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.layer = make_layer()
+        self.reads = []
+        self.layer.receive_twisted.side_effect = self.read
+        self.admission = AdmissionControl(self.layer, **CONFIG)
+        self.clock = Clock()
+        patcher = mock.patch('main.admission.reactor', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read(self, channels):
+        self.reads.append(defer.Deferred())
+        return self.reads[-1]
+
+    def receive(self, channels):
+        results = []
+        self.admission.receive_twisted(channels).addBoth(results.append)
+        return results
+
+    def send(self, count):
+        for i in range(count):
+            self.admission.send('http.request', request('reply!%d' % i))
+
+    def test_delegates_to_layer(self):
+        self.send(1)
+        results = self.receive(['reply!0'])
+        self.layer.receive_twisted.assert_called_once_with(['reply!0'])
+        self.assertEqual(results, [])
+        self.reads[0].callback(('reply!0', {'status': 200}))
+        self.assertEqual(results, [('reply!0', {'status': 200})])
+        self.assertEqual(self.admission.in_flight, {})
+
+    def test_rejection_returned_first(self):
+        self.send(5)
+        results = self.receive(['reply!0', 'reply!4'])
+        self.assertEqual(results[0][0], 'reply!4')
+        self.assertEqual(results[0][1]['status'], 503)
+        self.layer.receive_twisted.assert_not_called()
+
+    def test_rejection_wakes_reader(self):
+        self.send(4)
+        results = self.receive(['reply!%d' % i for i in range(5)])
+        self.admission.send('http.request', request('reply!4'))
+
+        # Answered once daphne's `send` has returned.
+        self.assertEqual(results, [])
+        self.clock.advance(0)
+        self.assertEqual(results[0][0], 'reply!4')
+        self.assertEqual(results[0][1]['status'], 503)
+
+        # The read still in progress is picked up by the next call.
+        results = self.receive(['reply!0'])
+        self.assertEqual(len(self.reads), 1)
+        self.reads[0].callback(('reply!0', {'status': 200}))
+        self.assertEqual(results, [('reply!0', {'status': 200})])
+
+    def test_message_read_while_unclaimed(self):
+        self.send(4)
+        self.receive(['reply!0', 'reply!4'])
+        self.admission.send('http.request', request('reply!4'))
+        self.clock.advance(0)
+        self.reads[0].callback(('reply!0', {'status': 200}))
+        self.assertEqual(self.receive(['reply!0']), [('reply!0', {'status': 200})])
+        self.assertEqual(len(self.reads), 1)
+
+    def test_empty_read(self):
+        results = self.receive(['reply!0'])
+        self.reads[0].callback((None, None))
+        self.assertEqual(results, [(None, None)])
+
+    def test_read_error(self):
+        results = self.receive(['reply!0'])
+        self.reads[0].errback(ValueError('broken'))
+        self.assertIsInstance(results[0].value, ValueError)
+        self.receive(['reply!0'])
+        self.assertEqual(len(self.reads), 2)
+
+
+class AdmissionLoadTestCase(SilentMixin, SimpleTestCase):
+    """ Saturate a Redis channel layer with no workers behind it.
+    """
+    def setUp(self):
+        super().setUp()
+        self.layer = DjangoRedisChannelLayer(
+            hosts=[settings.REDIS_URL], prefix='test-admission:', capacity=100
+        )
+        self.layer.flush()
+        self.addCleanup(self.layer.flush)
+        self.admission = AdmissionControl(self.layer, **dict(CONFIG, max_in_flight=40))
+
+    def load(self, clients, requests, path='/', headers=()):
+        """ Send requests from concurrent clients, returning their reply
+        channels. Errors raised to daphne fail the test.
+        """
+        reply_channels = []
+        errors = []
+
+        def client():
+            for i in range(requests):
+                reply_channel = self.layer.new_channel('http.response!')
+                reply_channels.append(reply_channel)
+                try:
+                    self.admission.send('http.request', request(reply_channel, path, headers))
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=client) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return reply_channels
+
+    def respond(self):
+        """ Act as a worker, answering every queued request.
+        """
+        while True:
+            _, message = self.layer.receive(['http.request'])
+            if message is None:
+                return
+            self.layer.send(message['reply_channel'], {'status': 200, 'content': b''})
+
+    def receive_all(self, reply_channels):
+        statuses = []
+        while True:
+            _, message = self.admission.receive(reply_channels)
+            if message is None:
+                return statuses
+            statuses.append(message['status'])
+
+    def depth(self):
+        return channel_depth(self.layer, 'http.request')
+
+    def test_saturated(self):
+        reply_channels = self.load(8, 50)
+        self.assertEqual(self.depth(), 40)
+        self.assertEqual(self.admission.shed, 360)
+
+        # Priority requests and health checks are still let through.
+        reply_channels += self.load(8, 10, path='/api/users', headers=SESSION)
+        self.assertEqual(self.depth(), 80)
+        reply_channels += self.load(4, 5, path='/health/')
+        self.assertEqual(self.depth(), 100)
+
+        # Once the workers catch up, requests are admitted again.
+        self.respond()
+        statuses = self.receive_all(reply_channels)
+        self.assertEqual(statuses.count(200), 100)
+        self.assertEqual(statuses.count(503), 400)
+        self.assertEqual(self.admission.in_flight, {})
+        self.load(8, 5)
+        self.assertEqual(self.depth(), 40)
+
+    def test_filling_channel(self):
+        for i in range(90):
+            self.layer.send('http.request', {'reply_channel': 'test!%d' % i})
+        self.load(8, 10)
+        self.assertEqual(self.admission.shed, 80)
+        self.load(1, 5, path='/api/users', headers=SESSION)
+        self.assertEqual(self.depth(), 95)
@@ -0,0 +1,51 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from ..management.commands.autoscale import Command
+
+
+CONFIG = {
+    'COOLDOWN': 6,
+    'SCALE_DOWN_BELOW': 0.5,
+    'CPU_TARGET': 70,
+    'LATENCY_TARGET': 0.5,
+    'PROBE_URL': '',
+    'BACKLOG_TARGET': 20,
+    'BACKLOG_CHANNELS': {},
+    'GROUPS': {
+        'daphne': {'min': 1, 'signals': ['cpu', 'latency']},
+        'channelsworker': {'min': 1, 'signals': ['cpu', 'backlog']},
+    },
+}
+
+
+class AutoscaleTestCase(SimpleTestCase):
+
+    def make_command(self, processes):
+        command = Command()
+        command.config = CONFIG
+        command.quiet = {group: 0 for group in CONFIG['GROUPS']}
+        command.supervisor = mock.Mock()
+        command.supervisor.getAllProcessInfo.return_value = processes
+        return command
+
+    def test_cpu_sampled_once_per_step(self):
+        command = self.make_command([
+            {'group': group, 'name': '%s_0' % group, 'statename': 'RUNNING'}
+            for group in CONFIG['GROUPS']
+        ])
+        with mock.patch('main.management.commands.autoscale.psutil.cpu_percent',
+                        return_value=35.0) as cpu_percent, \
+                mock.patch.object(command, 'backlog', return_value=0), \
+                mock.patch.object(command, 'scale') as scale:
+            command.step()
+        cpu_percent.assert_called_once_with()
+        self.assertEqual([c[0][3] for c in scale.call_args_list], [0.5, 0.5])
+
+    def test_pressure_is_highest_reading(self):
+        command = self.make_command([])
+        readings = {'cpu': 0.5, 'backlog': 2.0, 'latency': 3.0}
+        self.assertEqual(command.pressure(CONFIG['GROUPS']['channelsworker'], readings), 2.0)
+        self.assertEqual(command.pressure(CONFIG['GROUPS']['daphne'], readings), 3.0)
+        self.assertEqual(command.pressure({'signals': ['latency']}, {}), 0.0)
@@ -0,0 +1,82 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+
+from . import QueryCountMixin
+from ..backends import CachedModelBackend, user_cache_key
+
+
+class CachedModelBackendTestCase(QueryCountMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'secret')
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.backend = CachedModelBackend()
+        self.key = user_cache_key(self.user.pk)
+
+    def request(self):
+        # Reads request.user to check for staff, and refuses everyone else.
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 403)
+
+    def test_get_user_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+
+    def test_missing_user_not_cached(self):
+        self.assertIsNone(self.backend.get_user(0))
+        self.assertIsNone(cache.get(user_cache_key(0)))
+
+    def test_cold_cache_request(self):
+        self.client.force_login(self.user)
+        cache.clear()
+
+        # One query for the session and one for the user.
+        with self.assertMaxQueries(2):
+            self.request()
+        self.assertEqual(cache.get(self.key), self.user)
+
+    def test_warm_cache_request(self):
+        self.client.force_login(self.user)
+        self.request()
+        with self.assertMaxQueries(0):
+            self.request()
+
+    def test_save_invalidates(self):
+        self.backend.get_user(self.user.pk)
+        self.user.first_name = 'Alice'
+        self.user.save()
+        self.assertIsNone(cache.get(self.key))
+        self.assertEqual(self.backend.get_user(self.user.pk).first_name, 'Alice')
+
+    def test_password_change_invalidates(self):
+        self.client.force_login(self.user)
+        self.request()
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertIsNone(cache.get(self.key))
+
+        # The session's password hash no longer matches, so it's dropped.
+        self.request()
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_delete_invalidates(self):
+        self.backend.get_user(self.user.pk)
+        pk = self.user.pk
+        self.user.delete()
+        self.assertIsNone(cache.get(self.key))
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.backend.get_user(pk))
+
+    def test_logout_invalidates(self):
+        self.client.force_login(self.user)
+        self.request()
+        self.assertIsNotNone(cache.get(self.key))
+        self.client.logout()
+        self.assertIsNone(cache.get(self.key))
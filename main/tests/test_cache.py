@@ -0,0 +1,152 @@
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from ..cache import LocalLRU, TwoTierRedisCache, _missing
+
+
+class LocalLRUTestCase(SimpleTestCase):
+
+    def test_get_missing(self):
+        lru = LocalLRU(2)
+        self.assertIs(lru.get('a'), _missing)
+        self.assertEqual(lru.misses, 1)
+
+    def test_get_hit(self):
+        lru = LocalLRU(2)
+        lru.set('a', 1, 10)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(lru.hits, 1)
+
+    def test_expiry(self):
+        lru = LocalLRU(2)
+        with mock.patch('main.cache.time.monotonic', return_value=100.0):
+            lru.set('a', 1, 1)
+        with mock.patch('main.cache.time.monotonic', return_value=101.5):
+            self.assertIs(lru.get('a'), _missing)
+        self.assertEqual(len(lru), 0)
+        self.assertEqual(lru.misses, 1)
+
+    def test_evicts_least_recently_used(self):
+        lru = LocalLRU(2)
+        lru.set('a', 1, 10)
+        lru.set('b', 2, 10)
+        lru.get('a')
+        lru.set('c', 3, 10)
+        self.assertIs(lru.get('b'), _missing)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(lru.get('c'), 3)
+        self.assertEqual(lru.evictions, 1)
+
+    def test_delete_and_clear(self):
+        lru = LocalLRU(3)
+        lru.set('a', 1, 10)
+        lru.set('b', 2, 10)
+        lru.delete('a')
+        self.assertIs(lru.get('a'), _missing)
+        lru.clear()
+        self.assertEqual(len(lru), 0)
+
+
+class TwoTierRedisCacheTestCase(SimpleTestCase):
+
+    def make_cache(self, **options):
+        options.setdefault('LOCAL_TIMEOUT', 5)
+        return TwoTierRedisCache(settings.CACHES['default']['LOCATION'], {
+            'KEY_PREFIX': 'test-two-tier',
+            'OPTIONS': options,
+        })
+
+    def make_other_process_cache(self):
+        with mock.patch.dict('main.cache._tiers', clear=True):
+            return self.make_cache()
+
+    def setUp(self):
+        patcher = mock.patch.dict('main.cache._tiers', clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = self.make_cache()
+        self.cache.clear()
+
+    def test_get_serves_local_copy(self):
+        self.cache.set('a', 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        with mock.patch.object(self.cache, '_fetch') as fetch:
+            self.assertEqual(self.cache.get('a'), 1)
+        fetch.assert_not_called()
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_set_drops_local_copy(self):
+        self.cache.set('a', 1)
+        self.cache.get('a')
+        self.cache.set('a', 2)
+        self.assertEqual(self.cache.get('a'), 2)
+
+    def test_local_copy_expires_with_redis(self):
+        self.cache.set('a', 1, 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        time.sleep(1.1)
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_local_copy_lasts_at_most_local_timeout(self):
+        cache = self.make_cache(LOCAL_TIMEOUT=0.2)
+        cache.set('a', 1)
+        cache.get('a')
+        time.sleep(0.3)
+        with mock.patch.object(cache, '_fetch', return_value={}) as fetch:
+            cache.get('a')
+        fetch.assert_called_once_with([cache.make_key('a')])
+
+    def test_get_many_mixes_tiers(self):
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.cache.get('a')
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+
+    def test_threads_share_local_tier(self):
+        caches = []
+        thread = threading.Thread(target=lambda: caches.append(self.make_cache()))
+        thread.start()
+        thread.join()
+        other = caches[0]
+        self.assertIs(other._tier, self.cache._tier)
+        self.cache.set('a', 1)
+        self.cache.get('a')
+        with mock.patch.object(other, '_fetch') as fetch:
+            self.assertEqual(other.get('a'), 1)
+        fetch.assert_not_called()
+        self.assertEqual(self.cache.stats(), other.stats())
+        self.assertEqual(other.stats()['hits'], 1)
+
+    def test_one_listener_per_process(self):
+        other = self.make_cache()
+        self.cache.get('a')
+        other.get('a')
+        self.assertIsNotNone(self.cache._tier._listener)
+        self.assertIs(other._tier._listener, self.cache._tier._listener)
+
+    def test_invalidates_other_processes(self):
+        other = self.make_other_process_cache()
+        self.cache.set('a', 1)
+        self.assertEqual(other.get('a'), 1)
+        time.sleep(0.2)  # Let the listener subscribe.
+        self.cache.set('a', 2)
+        for _ in range(50):
+            if other._local.get(other.make_key('a')) is _missing:
+                break
+            time.sleep(0.05)
+        self.assertEqual(other.get('a'), 2)
+
+    def test_clear_invalidates_other_processes(self):
+        other = self.make_other_process_cache()
+        self.cache.set('a', 1)
+        other.get('a')
+        time.sleep(0.2)
+        self.cache.clear()
+        for _ in range(50):
+            if not len(other._local):
+                break
+            time.sleep(0.05)
+        self.assertEqual(len(other._local), 0)
@@ -0,0 +1,122 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import boto
+from django.test import SimpleTestCase, override_settings
+from moto import mock_s3_deprecated
+
+from ..management.commands.collectstatic import HASHES_NAME, Command
+from ..storage import S3ManifestStorage
+
+
+FILES = {
+    'css/app.0123456789ab.css': b'body { color: red; }\n',
+    'js/app.0123456789ab.js': b'console.log(1);\n',
+    'robots.txt': b'User-agent: *\n',
+    'staticfiles.json': b'{"paths": {}, "version": "1.0"}',
+}
+
+
+class IncrementalSyncTestCase(SimpleTestCase):
+    bucket_name = 'static-test'
+
+    def setUp(self):
+        mock = mock_s3_deprecated()
+        mock.start()
+        self.addCleanup(mock.stop)
+        self.bucket = boto.connect_s3('key', 'secret').create_bucket(self.bucket_name)
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings = override_settings(
+            STATIC_ROOT=self.root,
+            STATICFILES_STORAGE='main.storage.S3ManifestStorage',
+            AWS_STORAGE_BUCKET_NAME=self.bucket_name,
+            AWS_ACCESS_KEY_ID='key',
+            AWS_SECRET_ACCESS_KEY='secret',
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        for name, data in FILES.items():
+            self.write(name, data)
+
+    def write(self, name, data):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(data)
+
+    def sync(self, delete_stale=False):
+        """ Sync STATIC_ROOT to the bucket, returning the names saved in
+        the order they were saved.
+        """
+        command = Command(stdout=io.StringIO())
+        command.verbosity = 1
+        saved = []
+        save = S3ManifestStorage.save
+
+        def record(storage, name, content, *args, **kwargs):
+            saved.append(name)
+            return save(storage, name, content, *args, **kwargs)
+
+        with mock.patch.object(S3ManifestStorage, 'save', autospec=True, side_effect=record):
+            command.sync(4, delete_stale)
+        self.output = command.stdout.getvalue()
+        return saved
+
+    def get(self, name):
+        key = self.bucket.get_key(name)
+        return key and key.get_contents_as_string()
+
+    def test_first_sync(self):
+        saved = self.sync()
+        self.assertEqual(sorted(saved), sorted(list(FILES) + [HASHES_NAME]))
+        for name, data in FILES.items():
+            self.assertEqual(self.get(name), data)
+        self.assertEqual(sorted(json.loads(self.get(HASHES_NAME).decode())), sorted(FILES))
+        self.assertIn('4 of 4 files uploaded', self.output)
+
+    def test_manifest_uploaded_last(self):
+        saved = self.sync()
+        self.assertEqual(saved[-2:], ['staticfiles.json', HASHES_NAME])
+
+    def test_unchanged_files_skipped(self):
+        self.sync()
+        self.assertEqual(self.sync(), [HASHES_NAME])
+        self.assertIn('0 of 4 files uploaded', self.output)
+
+    def test_changed_files_uploaded(self):
+        self.sync()
+        self.write('css/app.0123456789ab.css', b'body { color: blue; }\n')
+        self.write('css/app.abcdef012345.css', b'body { color: green; }\n')
+        self.write('staticfiles.json', b'{"paths": {"a": "b"}, "version": "1.0"}')
+        saved = self.sync()
+        self.assertEqual(sorted(saved[:2]), [
+            'css/app.0123456789ab.css', 'css/app.abcdef012345.css',
+        ])
+        self.assertEqual(saved[2:], ['staticfiles.json', HASHES_NAME])
+        self.assertEqual(self.get('css/app.0123456789ab.css'), b'body { color: blue; }\n')
+        self.assertIn('3 of 5 files uploaded', self.output)
+
+    def test_stale_files_deleted(self):
+        self.write('js/old.0123456789ab.js', b'old\n')
+        self.sync()
+        os.remove(os.path.join(self.root, 'js/old.0123456789ab.js'))
+        with mock.patch.object(S3ManifestStorage, 'delete_many', autospec=True,
+                               side_effect=S3ManifestStorage.delete_many) as delete_many:
+            self.sync(delete_stale=True)
+        delete_many.assert_called_once_with(mock.ANY, ['js/old.0123456789ab.js'])
+        self.assertIsNone(self.bucket.get_key('js/old.0123456789ab.js'))
+        self.assertNotIn('js/old.0123456789ab.js', json.loads(self.get(HASHES_NAME).decode()))
+        self.assertIn('1 stale deleted', self.output)
+
+    def test_stale_files_kept(self):
+        self.write('js/old.0123456789ab.js', b'old\n')
+        self.sync()
+        os.remove(os.path.join(self.root, 'js/old.0123456789ab.js'))
+        self.sync()
+        self.assertEqual(self.get('js/old.0123456789ab.js'), b'old\n')
+        self.assertIn('1 stale kept', self.output)
@@ -0,0 +1,162 @@
+import random
+from unittest import mock
+
+from cq.models import Task
+from django.conf import settings
+from django.test import SimpleTestCase, TransactionTestCase
+from redis_channel_layer import DjangoRedisChannelLayer
+
+from . import SilentMixin
+from ..lanes import SENT_KEY, LanedChannelLayer, delay, delay_many
+
+
+LANES = {
+    'high': {'channel': 'test.high', 'capacity': 3, 'weight': 6},
+    'default': {'channel': 'test.default', 'capacity': 3, 'weight': 3},
+    'bulk': {'channel': 'test.bulk', 'capacity': 3, 'weight': 1},
+}
+
+CHANNELS = ['test.high', 'test.default', 'test.bulk']
+
+
+def add(a, b):
+    return a + b
+
+
+class LanedChannelLayerTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.layer = LanedChannelLayer(
+            hosts=[settings.REDIS_URL], prefix='test-lanes:', lanes=LANES
+        )
+        self.layer.flush()
+        self.addCleanup(self.layer.flush)
+
+    def receive_all(self, channel):
+        messages = []
+        while True:
+            _, message = self.layer.receive([channel])
+            if message is None:
+                return messages
+            messages.append(message)
+
+    def test_send_many_fills_to_capacity(self):
+        messages = [{'n': i} for i in range(5)]
+        self.assertEqual(self.layer.send_many('test.high', messages), 3)
+        self.assertEqual(self.layer.send_many('test.high', messages), 0)
+        self.assertEqual(self.receive_all('test.high'), messages[:3])
+        stats = self.layer.lane_stats()['high']
+        self.assertEqual((stats['sent'], stats['full'], stats['received']), (3, 2, 3))
+
+    def test_send_many_counts_queued_messages(self):
+        self.layer.send('test.high', {'n': 0})
+        self.assertEqual(self.layer.send_many('test.high', [{'n': 1}] * 3), 2)
+        self.assertEqual(self.layer.lane_depth('high'), 3)
+
+    def test_send_many_empty(self):
+        self.assertEqual(self.layer.send_many('test.high', []), 0)
+
+    def test_send_many_other_channels(self):
+        messages = [{'n': i} for i in range(5)]
+        self.assertEqual(self.layer.send_many('test.other', messages), 5)
+        self.assertEqual(self.receive_all('test.other'), messages)
+
+    def test_sent_time_removed(self):
+        self.layer.send('test.high', {'n': 0})
+        channel, message = self.layer.receive(['test.high'])
+        self.assertEqual(message, {'n': 0})
+        self.assertNotIn(SENT_KEY, message)
+        self.assertEqual(self.layer.lane_stats()['high']['received'], 1)
+
+    def test_weighted_order(self):
+        with mock.patch('main.lanes.random.uniform', side_effect=[7, 7, 0]):
+            order = self.layer.weighted_order(CHANNELS)
+        self.assertEqual(order, ['test.default', 'test.bulk', 'test.high'])
+
+    def test_weighted_order_distribution(self):
+        first = {channel: 0 for channel in CHANNELS}
+        with mock.patch('main.lanes.random', random.Random(0)):
+            for i in range(5000):
+                first[self.layer.weighted_order(CHANNELS)[0]] += 1
+        for channel, share in zip(CHANNELS, (0.6, 0.3, 0.1)):
+            self.assertAlmostEqual(first[channel] / 5000, share, delta=0.03)
+
+    def test_receive_in_weighted_order(self):
+        self.layer.send('test.high', {'n': 0})
+        self.layer.send('test.bulk', {'n': 1})
+        order = ['test.bulk', 'test.default', 'test.high']
+        with mock.patch.object(self.layer, 'weighted_order', return_value=order):
+            self.assertEqual(self.layer.receive(CHANNELS), ('test.bulk', {'n': 1}))
+            self.assertEqual(self.layer.receive(CHANNELS), ('test.high', {'n': 0}))
+            self.assertEqual(self.layer.receive(CHANNELS), (None, None))
+
+    def test_other_channels_not_weighted(self):
+        self.layer.send('test.high', {'n': 0})
+        with mock.patch.object(self.layer, 'weighted_order') as weighted_order:
+            channel, message = self.layer.receive(['test.high', 'test.other'])
+        weighted_order.assert_not_called()
+        self.assertEqual(channel, 'test.high')
+
+
+class DelayTestCase(SilentMixin, TransactionTestCase):
+
+    def test_delay(self):
+        with mock.patch('main.lanes.Channel') as channel:
+            task = delay('high', add, (1, 2))
+        channel.assert_called_once_with(
+            settings.CQ_LANES['high']['channel'], alias=settings.CQ_CHANNEL_LAYER
+        )
+        channel.return_value.send.assert_called_once_with(
+            {'task_id': str(task.id)}, immediately=True
+        )
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.STATUS_QUEUED)
+        self.assertEqual(task.signature['args'], [1, 2])
+
+    def test_delay_unknown_lane(self):
+        with self.assertRaises(ValueError):
+            delay('unknown', add, (1, 2))
+
+    def test_delay_full_lane(self):
+        with mock.patch('main.lanes.Channel') as channel:
+            channel.return_value.send.side_effect = DjangoRedisChannelLayer.ChannelFull
+            task = delay('high', add, (1, 2))
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.STATUS_RETRY)
+
+    def mock_layer(self, sent):
+        layer = mock.Mock()
+        layer.channel_layer.send_many.return_value = sent
+        return mock.patch('main.lanes.channel_layers', {
+            settings.CQ_CHANNEL_LAYER: layer,
+        }), layer.channel_layer
+
+    def test_delay_many(self):
+        patcher, layer = self.mock_layer(3)
+        with patcher, self.assertNumQueries(1):
+            tasks = delay_many('bulk', [(add, (i, i), {}) for i in range(3)])
+        layer.send_many.assert_called_once_with(
+            settings.CQ_LANES['bulk']['channel'],
+            [{'task_id': str(t.id)} for t in tasks]
+        )
+        self.assertEqual(
+            sorted(t.signature['args'] for t in Task.objects.all()),
+            [[0, 0], [1, 1], [2, 2]]
+        )
+        self.assertEqual(
+            set(Task.objects.values_list('status', flat=True)), {Task.STATUS_QUEUED}
+        )
+
+    def test_delay_many_full_lane(self):
+        patcher, layer = self.mock_layer(2)
+        with patcher:
+            tasks = delay_many('bulk', [(add, (i, i), {}) for i in range(3)])
+        statuses = dict(Task.objects.values_list('id', 'status'))
+        self.assertEqual([statuses[t.id] for t in tasks], [
+            Task.STATUS_QUEUED, Task.STATUS_QUEUED, Task.STATUS_RETRY,
+        ])
+        self.assertEqual(tasks[2].status, Task.STATUS_RETRY)
+
+    def test_delay_many_unknown_lane(self):
+        with self.assertRaises(ValueError):
+            delay_many('unknown', [(add, (1, 2), {})])
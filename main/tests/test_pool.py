@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.test import SimpleTestCase
+from redis.exceptions import ConnectionError
+
+from . import SilentMixin
+from ..pool import MeteredBlockingConnectionPool, wait_stats
+
+
+class MeteredBlockingConnectionPoolTestCase(SilentMixin, SimpleTestCase):
+
+    def make_pool(self, **kwargs):
+        pool = MeteredBlockingConnectionPool.from_url(settings.REDIS_URL, **kwargs)
+        self.addCleanup(pool.disconnect)
+        return pool
+
+    def test_records_waits(self):
+        pool = self.make_pool(max_connections=2, timeout=1)
+        pool.release(pool.get_connection('PING'))
+        stats = pool.wait_stats()
+        self.assertEqual(stats['count'], 1)
+        self.assertEqual(stats['timeouts'], 0)
+        self.assertEqual(stats['size'], 2)
+
+    def test_records_timeouts(self):
+        pool = self.make_pool(max_connections=1, timeout=0.1, warn_wait=0.05)
+        connection = pool.get_connection('PING')
+        self.addCleanup(pool.release, connection)
+        with self.assertRaises(ConnectionError):
+            pool.get_connection('PING')
+        stats = pool.wait_stats()
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(stats['slow'], 1)
+        self.assertEqual(stats['timeouts'], 1)
+
+    def test_process_totals(self):
+        pool = self.make_pool(max_connections=1, timeout=0.1)
+        before = wait_stats()
+        connection = pool.get_connection('PING')
+        self.addCleanup(pool.release, connection)
+        with self.assertRaises(ConnectionError):
+            pool.get_connection('PING')
+        after = wait_stats()
+        self.assertEqual(after['count'] - before['count'], 2)
+        self.assertEqual(after['timeouts'] - before['timeouts'], 1)
@@ -0,0 +1,36 @@
+import os
+import signal
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, override_settings
+
+from ..profiler import request_path
+
+
+class ProfileCommandTestCase(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch('main.management.commands.profile.os.kill')
+        self.kill = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: os.path.exists(request_path(0)) and os.remove(request_path(0)))
+
+    @override_settings(PROFILER_ENABLED=True)
+    def test_profile(self):
+        call_command('profile', '0', seconds=5, stdout=mock.Mock())
+        self.kill.assert_called_once_with(0, signal.SIGUSR2)
+        with open(request_path(0)) as request:
+            self.assertEqual(request.read(), '5')
+
+    @override_settings(PROFILER_ENABLED=False)
+    def test_disabled(self):
+        with self.assertRaises(CommandError):
+            call_command('profile', '0')
+        self.kill.assert_not_called()
+
+    @override_settings(PROFILER_ENABLED=True)
+    def test_invalid_seconds(self):
+        with self.assertRaises(CommandError):
+            call_command('profile', '0', seconds=0)
+        self.kill.assert_not_called()
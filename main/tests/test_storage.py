@@ -0,0 +1,55 @@
+import gzip
+
+import boto
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+from moto import mock_s3_deprecated
+
+from ..storage import IMMUTABLE, S3ManifestStorage
+
+
+class S3ManifestStorageTestCase(SimpleTestCase):
+    bucket_name = 'static-test'
+
+    def setUp(self):
+        mock = mock_s3_deprecated()
+        mock.start()
+        self.addCleanup(mock.stop)
+        boto.connect_s3('key', 'secret').create_bucket(self.bucket_name)
+        self.storage = S3ManifestStorage(
+            bucket=self.bucket_name, access_key='key', secret_key='secret'
+        )
+
+    def get_key(self, name):
+        return self.storage.bucket.get_key(name)
+
+    def test_save_compressed_copy(self):
+        data = b'body { color: red; }\n' * 50
+        name = self.storage.save('css/app.0123456789ab.css', ContentFile(data))
+        self.assertEqual(name, 'css/app.0123456789ab.css')
+
+        key = self.get_key(name)
+        self.assertEqual(key.content_type, 'text/css')
+        self.assertEqual(key.cache_control, IMMUTABLE)
+        self.assertIsNone(key.content_encoding)
+
+        key = self.get_key(name + '.gz')
+        self.assertEqual(key.content_type, 'text/css')
+        self.assertEqual(key.content_encoding, 'gzip')
+        self.assertEqual(key.cache_control, IMMUTABLE)
+        self.assertEqual(gzip.decompress(key.get_contents_as_string()), data)
+
+    def test_save_small_file_uncompressed(self):
+        name = self.storage.save('css/app.0123456789ab.css', ContentFile(b'a{}'))
+        self.assertIsNotNone(self.get_key(name))
+        self.assertIsNone(self.get_key(name + '.gz'))
+
+    def test_unhashed_names_cached_briefly(self):
+        name = self.storage.save('robots.txt', ContentFile(b'User-agent: *\n'))
+        self.assertEqual(self.get_key(name).cache_control, 'public, max-age=300')
+
+    def test_manifest_not_cached(self):
+        self.storage.save_manifest()
+        key = self.get_key(self.storage.manifest_name)
+        self.assertEqual(key.cache_control, 'no-cache')
+        self.assertIsNone(self.get_key(self.storage.manifest_name + '.gz'))
@@ -0,0 +1,132 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import RequestFactory, TestCase, override_settings
+
+from ..views import clear_api_cache, index_etag
+
+
+def render_index(template_names, context, request=None):
+    """ Render a stand-in for the index page, without webpack bundles.
+    """
+    return '<script>var jsdata = %s;</script><script>var csrf = "%s";</script>' % (
+        json.dumps(context['view'].get_jsdata()), context['csrf_token']
+    )
+
+
+class IndexViewTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'secret')
+        cls.other = User.objects.create_user('bob', 'bob@example.com', 'secret')
+
+    def setUp(self):
+        clear_api_cache()
+        self.addCleanup(clear_api_cache)
+        patcher = mock.patch('main.views.render_to_string', side_effect=render_index)
+        self.render = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_request(self, user=None, csrf='a' * 64):
+        request = RequestFactory().get('/')
+        request.user = user or AnonymousUser()
+        request.META['CSRF_COOKIE'] = csrf
+        return request
+
+    def test_etag(self):
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"%s"' % index_etag(response.wsgi_request))
+
+    def test_not_modified(self):
+        etag = self.client.get('/')['ETag']
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_etag_changes_with_user(self):
+        etags = {
+            index_etag(self.make_request(user))
+            for user in (None, self.user, self.other)
+        }
+        self.assertEqual(len(etags), 3)
+
+    def test_etag_changes_with_csrf_token(self):
+        self.assertNotEqual(
+            index_etag(self.make_request(csrf='a' * 64)),
+            index_etag(self.make_request(csrf='b' * 64))
+        )
+
+    def test_stale_etag_after_login(self):
+        etag = self.client.get('/')['ETag']
+        self.client.force_login(self.user)
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_page_rendered_once(self):
+        self.client.get('/')
+        self.client.force_login(self.user)
+        self.client.get('/')
+        self.assertEqual(self.render.call_count, 1)
+
+    def test_user_spliced(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/')
+        content = response.content.decode()
+        jsdata = json.loads(content[content.index('{'):content.index(';</script>')])
+        self.assertEqual(jsdata['user'], {
+            'id': self.user.id, 'email': 'alice@example.com', 'username': 'alice',
+        })
+        self.assertIn('static', jsdata)
+
+    def test_anonymous_user(self):
+        content = self.client.get('/').content.decode()
+        jsdata = json.loads(content[content.index('{'):content.index(';</script>')])
+        self.assertIsNone(jsdata['user'])
+
+    def test_csrf_token_spliced(self):
+        response = self.client.get('/')
+        self.assertNotIn(b'__index_csrf__', response.content)
+        self.assertIn('csrftoken', response.cookies)
+        self.assertIn(b'var csrf = "', response.content)
+
+
+@override_settings(PROFILER_ENABLED=True)
+class ProfileViewTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'secret')
+        cls.user.is_staff = True
+        cls.user.save()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        patcher = mock.patch('main.views.start_profile', return_value='profiles/test.folded')
+        self.start_profile = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_profile(self):
+        response = self.client.post('/profile/', {'seconds': '2.5'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode())['name'], 'profiles/test.folded')
+        self.start_profile.assert_called_once_with(2.5)
+
+    def test_invalid_seconds(self):
+        for seconds in ('abc', '', '0', '-5', 'nan', 'inf'):
+            response = self.client.post('/profile/', {'seconds': seconds})
+            self.assertEqual(response.status_code, 400, seconds)
+        self.start_profile.assert_not_called()
+
+    def test_staff_only(self):
+        self.user.is_staff = False
+        self.user.save()
+        response = self.client.post('/profile/', {'seconds': '5'})
+        self.assertEqual(response.status_code, 403)
+        self.start_profile.assert_not_called()
+
+    @override_settings(PROFILER_ENABLED=False)
+    def test_disabled(self):
+        self.assertEqual(self.client.post('/profile/').status_code, 404)
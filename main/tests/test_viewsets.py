@@ -0,0 +1,190 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.test import RequestFactory, TestCase
+from rest_framework import viewsets
+from rest_framework_json_api import serializers
+
+from . import QueryCountMixin
+from .. import metrics
+from ..renderers import JSONRenderer
+from ..viewsets import QueryPlanMixin, SerializationTimingMixin, get_related_plan
+
+
+class ContentTypeSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = ContentType
+        fields = ('app_label', 'model')
+
+
+class PermissionSerializer(serializers.ModelSerializer):
+    included_serializers = {
+        'content_type': ContentTypeSerializer,
+    }
+
+    class Meta:
+        model = Permission
+        fields = ('name', 'codename', 'content_type')
+
+
+class GroupSerializer(serializers.ModelSerializer):
+    included_serializers = {
+        'permissions': PermissionSerializer,
+    }
+
+    class Meta:
+        model = Group
+        fields = ('name', 'permissions')
+
+
+class UserSerializer(serializers.ModelSerializer):
+    included_serializers = {
+        'groups': GroupSerializer,
+        'user_permissions': PermissionSerializer,
+    }
+
+    class Meta:
+        model = User
+        fields = ('username', 'email', 'groups', 'user_permissions')
+
+
+class UserViewSet(QueryPlanMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = User.objects.order_by('pk')
+    serializer_class = UserSerializer
+    renderer_classes = (JSONRenderer,)
+    pagination_class = None
+    authentication_classes = ()
+    permission_classes = ()
+
+
+class RelatedPlanTestCase(TestCase):
+
+    def test_relationships(self):
+        self.assertEqual(get_related_plan(User, UserSerializer), (
+            (), ('groups', 'user_permissions'),
+        ))
+
+    def test_nested_include(self):
+        self.assertEqual(
+            get_related_plan(User, UserSerializer, ('groups.permissions.content_type',)),
+            ((), (
+                'groups', 'groups__permissions', 'groups__permissions__content_type',
+                'user_permissions',
+            ))
+        )
+
+    def test_single_valued_include(self):
+        self.assertEqual(
+            get_related_plan(Permission, PermissionSerializer, ('content_type',)),
+            (('content_type',), ())
+        )
+
+    def test_dasherized_and_camel_cased_names(self):
+        plan = get_related_plan(User, UserSerializer, ('user_permissions.content_type',))
+        for path in ('user-permissions.content-type', 'userPermissions.contentType'):
+            self.assertEqual(get_related_plan(User, UserSerializer, (path,)), plan)
+
+    def test_unknown_names_ignored(self):
+        self.assertEqual(
+            get_related_plan(User, UserSerializer, ('groups.unknown', 'unknown')),
+            get_related_plan(User, UserSerializer, ('groups',))
+        )
+
+
+class QueryPlanMixinTestCase(QueryCountMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        permissions = list(Permission.objects.order_by('pk')[:6])
+        cls.groups = []
+        for i in range(3):
+            group = Group.objects.create(name='group%d' % i)
+            group.permissions.set(permissions[i * 2:i * 2 + 2])
+            cls.groups.append(group)
+        cls.permissions = permissions
+
+    def add_users(self, count):
+        for i in range(User.objects.count(), User.objects.count() + count):
+            user = User.objects.create_user('user%d' % i)
+            user.groups.set(self.groups[i % 3:i % 3 + 2])
+            user.user_permissions.add(self.permissions[i % 6])
+
+    def list(self, params):
+        view = UserViewSet.as_view({'get': 'list'})
+        response = view(RequestFactory().get('/', params))
+        response.render()
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode())
+
+    def assertFixedQueries(self, num, params):
+        """ Listing takes at most `num` queries however many users there are.
+        """
+        for count in (2, 10):
+            self.add_users(count)
+            with self.assertMaxQueries(num):
+                document = self.list(params)
+            self.assertEqual(len(document['data']), User.objects.count())
+        return document
+
+    def test_relationships(self):
+        self.assertFixedQueries(3, {})
+
+    def test_nested_include(self):
+        document = self.assertFixedQueries(5, {
+            'include': 'groups.permissions.content-type',
+        })
+        types = {resource['type'] for resource in document['included']}
+        self.assertEqual(len(types), 3)
+
+    def test_camel_cased_include(self):
+        self.assertFixedQueries(5, {
+            'include': 'userPermissions.contentType,groups',
+        })
+
+    def test_sparse_fieldsets(self):
+        self.assertFixedQueries(4, {
+            'include': 'groups',
+            'fields[User]': 'username,groups',
+            'fields[Group]': 'name',
+        })
+
+
+class TimedUserViewSet(SerializationTimingMixin, UserViewSet):
+    pass
+
+
+class SerializationTimingMixinTestCase(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('alice')
+        metrics.start_request('test')
+        self.addCleanup(metrics.end_request)
+
+    def serialize(self, monotonic, query_time=0.0):
+        view = TimedUserViewSet.as_view({'get': 'list'})
+        with mock.patch('main.metrics.time.monotonic', side_effect=monotonic), \
+                mock.patch('main.metrics.query_time', return_value=query_time):
+            response = view(RequestFactory().get('/'))
+        self.assertEqual(response.data[0]['username'], 'alice')
+        self.assertIsInstance(response.data.serializer.child, UserSerializer)
+        return metrics._local.timings
+
+    def test_serialization_timed(self):
+        self.assertEqual(self.serialize([1.0, 1.5])['serialization'], 0.5)
+
+    def test_nested_db_time_left_out(self):
+        timings = self.serialize([1.0, 1.5], query_time=0.1)
+        self.assertAlmostEqual(timings['serialization'], 0.4)
+
+    def test_nested_cache_time_left_out(self):
+        with mock.patch('main.metrics.time.monotonic', side_effect=[1.0, 1.1, 1.3, 1.5]):
+            with metrics.timed_serialization():
+                with metrics.timed('cache'):
+                    pass
+        timings = metrics.finish_request(2.0)
+        self.assertAlmostEqual(timings['cache'], 0.2)
+        self.assertAlmostEqual(timings['serialization'], 0.3)
+        self.assertAlmostEqual(timings['other'], 1.5)
@@ -1,8 +1,11 @@
 from django.conf.urls import include, url
 
-from .views import IndexView
+from .views import IndexView, health, metrics, profile
 
 
 urlpatterns = [
     url(r'^$', IndexView.as_view(), name='index'),
+    url(r'^health/$', health, name='health'),
+    url(r'^metrics$', metrics, name='metrics'),
+    url(r'^profile/$', profile, name='profile'),
 ]
@@ -1,16 +1,97 @@
+import hashlib
 import importlib
+import json
 import logging
+import os
+import time
 
+from django.http import (
+    Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+)
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
 from django.views.generic import TemplateView
-from django.core.urlresolvers import reverse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.urlresolvers import reverse, get_urlconf
 from django.urls.exceptions import NoReverseMatch
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition, require_POST
 from django.conf import settings
 from jsdata.views import DRFViewMixin
 
+from . import metrics as request_metrics
+from .profiler import start_profile
+
 
 logger = logging.getLogger(__name__)
 
 
+# Process-wide cache of resolved API descriptors, keyed by the URL and
+# router configuration they were built from. Cleared when either changes.
+_api_cache = {}
+
+# User independent index data and rendered pages, keyed by deploy.
+_jsdata_cache = {}
+_page_cache = {}
+
+# Stand in for the user and CSRF token in cached index pages.
+USER_MARKER = '__index_user__'
+CSRF_MARKER = '__index_csrf__'
+
+# Stands in for the deploy version when none is configured, so index
+# ETags never outlive the process that issued them.
+_process_token = str(time.time())
+
+
+def clear_api_cache(**kwargs):
+    _api_cache.clear()
+    _jsdata_cache.clear()
+    _page_cache.clear()
+
+
+def get_deploy_version():
+    return settings.DEPLOY_VERSION or _process_token
+
+
+def get_user_jsdata(user):
+    if not user.is_authenticated():
+        return {}
+    data = {
+        'id': user.id,
+        'email': user.email,
+    }
+    try:
+        data['username'] = user.username
+    except AttributeError:
+        data['username'] = user.email
+    return {'user': data}
+
+
+def dump_user_jsdata(user):
+    """ The user's jsdata as JSON that is safe inside a script element.
+    """
+    data = json.dumps(get_user_jsdata(user).get('user'), cls=DjangoJSONEncoder)
+    return data.replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026')
+
+
+def index_etag(request):
+    """ ETag for the index page.
+
+    The page only varies by deploy, user and CSRF secret, so there's no
+    need to render it to know whether the client's copy is current.
+    """
+    if settings.DEBUG:
+        return None
+    parts = (
+        get_deploy_version(),
+        get_urlconf() or settings.ROOT_URLCONF,
+        settings.STATIC_URL,
+        sorted(get_user_jsdata(request.user).get('user', {}).items()),
+        request.META.get('CSRF_COOKIE', ''),
+    )
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
 class APIViewMixin(DRFViewMixin):
     api_prefix = '/api/v1/'
 
@@ -18,7 +99,14 @@ class APIViewMixin(DRFViewMixin):
         router = importlib.import_module(settings.ROOT_ROUTERCONF)
         return router.router
 
-    def get_api(self, **kwargs):
+    def get_api_cache_key(self):
+        return (
+            get_urlconf() or settings.ROOT_URLCONF,
+            settings.ROOT_ROUTERCONF,
+            self.api_prefix,
+        )
+
+    def build_api(self):
         api = {
             'login': reverse('login'),
             'logout': reverse('logout'),
@@ -27,25 +115,117 @@ class APIViewMixin(DRFViewMixin):
             api['password_change'] = reverse('password_change')
         except NoReverseMatch:
             pass
-        api.update(kwargs)
         return super(APIViewMixin, self).get_api(**api)
 
+    def get_api(self, **kwargs):
+        key = self.get_api_cache_key()
+        try:
+            api = _api_cache[key]
+        except KeyError:
+            api = _api_cache[key] = self.build_api()
+        api = dict(api)
+        api.update(kwargs)
+        return api
 
+
+@method_decorator(condition(etag_func=index_etag), name='get')
 class IndexView(APIViewMixin, TemplateView):
+    """ The single page app's entry point.
+
+    The page is rendered once per deploy with markers in place of the
+    user and CSRF token, which are spliced in per request.
+    """
     template_name = 'index.html'
+    render_markers = False
+
+    def get(self, request, *args, **kwargs):
+        page = self.get_static_page()
+        if page is None:
+            return super().get(request, *args, **kwargs)
+        page = page.replace('"%s"' % USER_MARKER, dump_user_jsdata(request.user), 1)
+        return HttpResponse(page.replace(CSRF_MARKER, get_token(request)))
+
+    def get_static_page(self):
+        if settings.DEBUG:
+            return None
+        key = (get_deploy_version(),) + self.get_api_cache_key()
+        try:
+            page = _page_cache[key]
+        except KeyError:
+            page = _page_cache[key] = self.render_static_page()
+        return page
+
+    def render_static_page(self):
+        """ Render the page with markers for the user and CSRF token, or
+        return None when the markers don't survive rendering and the page
+        has to be rendered per request.
+        """
+        self.render_markers = True
+        try:
+            context = self.get_context_data(csrf_token=CSRF_MARKER)
+            page = render_to_string(self.get_template_names(), context, self.request)
+        finally:
+            self.render_markers = False
+        if page.count('"%s"' % USER_MARKER) != 1 or CSRF_MARKER not in page:
+            logger.warning('Index page markers not found, rendering per request.')
+            return None
+        return page
+
+    def get_static_jsdata(self):
+        key = (get_deploy_version(),) + self.get_api_cache_key()
+        try:
+            data = _jsdata_cache[key]
+        except KeyError:
+            data = _jsdata_cache[key] = super().get_jsdata(
+                static=settings.STATIC_URL
+            )
+        return data
 
     def get_jsdata(self):
-        data = {
-            'static': settings.STATIC_URL
-        }
-        if self.request.user.is_authenticated():
-            user = self.request.user
-            data['user'] = {
-                'id': user.id,
-                'email': user.email,
-            }
-            try:
-                data['user']['username'] = user.username
-            except AttributeError:
-                data['user']['username'] = user.email
-        return super().get_jsdata(**data)
+        data = dict(self.get_static_jsdata())
+        if self.render_markers:
+            data['user'] = USER_MARKER
+        else:
+            data.update(get_user_jsdata(self.request.user))
+        return data
+
+
+def health(request):
+    return HttpResponse('ok', content_type='text/plain')
+
+
+def metrics(request):
+    """ Prometheus metrics for the process serving the request.
+
+    Open to staff, or to scrapers presenting `METRICS_TOKEN` as a
+    bearer token.
+    """
+    token = settings.METRICS_TOKEN
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if not (token and authorization == 'Bearer %s' % token):
+        if not request.user.is_staff:
+            return HttpResponseForbidden()
+    return HttpResponse(
+        request_metrics.render_prometheus() + request_metrics.render_stats(),
+        content_type='text/plain; version=0.0.4'
+    )
+
+
+@require_POST
+def profile(request):
+    """ Profile the process serving the request for `seconds`.
+    """
+    if not settings.PROFILER_ENABLED:
+        raise Http404
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    try:
+        seconds = float(request.POST.get('seconds', 30))
+    except ValueError:
+        seconds = 0
+    if not 0 < seconds < float('inf'):
+        return JsonResponse({'error': 'seconds must be a positive number.'}, status=400)
+    name = start_profile(seconds)
+    if name is None:
+        return JsonResponse({'error': 'A profile is already running.'}, status=409)
+    return JsonResponse({'name': name, 'pid': os.getpid()})
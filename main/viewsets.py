@@ -0,0 +1,227 @@
+from functools import lru_cache
+
+import inflection
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
+from django.utils.module_loading import import_string
+from rest_framework.relations import ManyRelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+from .metrics import timed_serialization
+from .renderers import StreamingJSONRenderer
+
+
+class CacheBatchMixin(object):
+    """ Prefetch the cache keys a list of objects will need.
+
+    Override `get_cache_keys` to return the keys serializers will read
+    through `request.cache_batch`; they are then fetched with a single
+    round trip before serialization starts.
+    """
+    def get_cache_keys(self, objects):
+        return []
+
+    def get_serializer(self, *args, **kwargs):
+        if kwargs.get('many') and args:
+            batch = getattr(self.request, 'cache_batch', None)
+            if batch is not None:
+                batch.want(*self.get_cache_keys(args[0]))
+        return super().get_serializer(*args, **kwargs)
+
+
+class TimedDataMixin(object):
+
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+@lru_cache(maxsize=None)
+def timed_serializer_class(serializer_class):
+    return type(serializer_class.__name__, (TimedDataMixin, serializer_class), {})
+
+
+class SerializationTimingMixin(object):
+    """ Time `serializer.data` as the request's serialization phase.
+
+    Serializers from `get_serializer` are given a subclass whose `data`
+    is timed by `main.metrics`. Lists are timed once, as a whole.
+    """
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        serializer.__class__ = timed_serializer_class(serializer.__class__)
+        return serializer
+
+
+class StreamingListMixin(object):
+    """ Stream list responses when `StreamingJSONRenderer` is selected.
+
+    Unpaginated lists are read with `queryset.iterator()` so model
+    instances are never all held at once. The iterator ignores
+    `prefetch_related`, so those lookups are run for each chunk instead.
+    """
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if not isinstance(renderer, StreamingJSONRenderer):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        meta = links = None
+        lookups = ()
+        if page is not None:
+            objects = page
+            paginated = self.get_paginated_response([]).data
+            meta = paginated.get('meta')
+            links = paginated.get('links')
+        else:
+            objects = queryset.iterator()
+            lookups = queryset._prefetch_related_lookups
+
+        def get_serializer(chunk):
+            if lookups:
+                prefetch_related_objects(chunk, *lookups)
+            return self.get_serializer(chunk, many=True)
+
+        stream = renderer.render_stream(
+            objects,
+            get_serializer,
+            self.get_renderer_context(),
+            meta=meta,
+            links=links
+        )
+        content_type = '%s; charset=%s' % (renderer.media_type, renderer.charset)
+        return StreamingHttpResponse(stream, content_type=content_type)
+
+
+def get_model_field(model, source):
+    if not source or source == '*' or '.' in source:
+        return None
+    try:
+        return model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return None
+
+
+def get_included_serializer(serializer_class, name):
+    included = getattr(serializer_class, 'included_serializers', None) or {}
+    serializer = included.get(name)
+    if isinstance(serializer, str):
+        serializer = import_string(serializer)
+    return serializer
+
+
+def get_include_field(serializer_class, name):
+    """ The serializer field named by one segment of an `include` path.
+
+    Segments may be dasherized or camelCased, as JSON:API clients send
+    them; the field's name is returned with it.
+    """
+    fields = serializer_class().fields
+    for candidate in (name, inflection.underscore(name)):
+        field = fields.get(candidate)
+        if field is not None:
+            return candidate, field
+    return None, None
+
+
+def plan_fields(model, serializer_class, prefix, select, prefetch):
+    """ Add the lookups needed to render one serializer's relationships.
+
+    Single-valued relationships render from the foreign key column and
+    need nothing; many-valued ones and nested serializers do.
+    """
+    for name, field in serializer_class().fields.items():
+        if isinstance(field, (ListSerializer, ManyRelatedField)):
+            many = True
+        elif isinstance(field, BaseSerializer):
+            many = False
+        else:
+            continue
+        model_field = get_model_field(model, field.source)
+        if model_field is None:
+            continue
+        if many or model_field.many_to_many or model_field.one_to_many:
+            prefetch.add(prefix + field.source)
+        else:
+            select.add(prefix + field.source)
+
+
+def plan_include(model, serializer_class, path, select, prefetch):
+    """ Add the lookups needed to include one dotted `include` path.
+
+    Returns the part of `path` that could be followed.
+    """
+    lookup = []
+    names = []
+    many = False
+    for name in path.split('.'):
+        field_name, field = get_include_field(serializer_class, name)
+        if field is None:
+            break
+        model_field = get_model_field(model, field.source)
+        if model_field is None:
+            break
+        names.append(name)
+        lookup.append(field.source)
+        many = many or model_field.many_to_many or model_field.one_to_many
+        (prefetch if many else select).add('__'.join(lookup))
+        model = model_field.related_model
+        serializer_class = get_included_serializer(serializer_class, field_name)
+        if serializer_class is None:
+            break
+        plan_fields(
+            model, serializer_class, '__'.join(lookup) + '__',
+            prefetch if many else select, prefetch
+        )
+    return '.'.join(names)
+
+
+@lru_cache(maxsize=256)
+def _related_plan(model, serializer_class, includes):
+    select, prefetch = set(), set()
+    plan_fields(model, serializer_class, '', select, prefetch)
+    for path in includes:
+        plan_include(model, serializer_class, path, select, prefetch)
+    return tuple(sorted(select)), tuple(sorted(prefetch))
+
+
+@lru_cache(maxsize=1024)
+def get_related_plan(model, serializer_class, includes=()):
+    """ Lookups needed to render `serializer_class` with `includes`.
+
+    Plans are computed for the part of each include path that exists,
+    so requests naming the same resources share one; both caches are
+    bounded, so arbitrary `include` values can't grow them.
+    """
+    valid = set()
+    for path in includes:
+        path = plan_include(model, serializer_class, path, set(), set())
+        if path:
+            valid.add(path)
+    return _related_plan(model, serializer_class, tuple(sorted(valid)))
+
+
+class QueryPlanMixin(object):
+    """ Apply `select_related`/`prefetch_related` from the serializer.
+
+    Relationship fields of the serializer and the paths named in the
+    `include` query parameter are mapped to lookups, so neither
+    relationships nor included resources cost a query per object.
+    """
+    def get_include_paths(self):
+        include = self.request.query_params.get('include', '')
+        return [p for p in include.split(',') if p]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        select, prefetch = get_related_plan(
+            queryset.model, self.get_serializer_class(),
+            tuple(sorted(set(self.get_include_paths())))
+        )
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
@@ -0,0 +1,52 @@
+""" Webpack stats loading.
+
+With `CACHE` off, django-webpack-loader re-reads and re-parses the stats
+file for every bundle included in every render. `CachedWebpackLoader`
+keeps the parsed stats and only reads the file again once its mtime or
+size changes, which is when webpack has finished a build. With `CACHE`
+on, stats are read once, when the app is ready.
+"""
+import logging
+import os
+import threading
+
+from webpack_loader.loader import WebpackLoader
+from webpack_loader.utils import get_loader
+
+
+logger = logging.getLogger(__name__)
+
+
+class CachedWebpackLoader(WebpackLoader):
+
+    _stats = {}
+    _stats_lock = threading.Lock()
+
+    def get_assets(self):
+        if self.config['CACHE']:
+            return super().get_assets()
+        path = self.config['STATS_FILE']
+        try:
+            stat = os.stat(path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+        cached = self._stats.get(self.name)
+        if signature is not None and cached is not None and cached[0] == signature:
+            return cached[1]
+        with self._stats_lock:
+            assets = self._load_assets()
+            self._stats[self.name] = (signature, assets)
+        return assets
+
+
+def preload(config):
+    """ Read the stats of every cached loader up front.
+    """
+    for name, options in config.items():
+        if not options.get('CACHE'):
+            continue
+        try:
+            get_loader(name).get_assets()
+        except IOError:
+            logger.warning('Webpack stats for %s are missing.', name)
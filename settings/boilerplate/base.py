@@ -29,19 +29,63 @@ INSTALLED_APPS = INSTALLED_APPS + [
     'channels'
 ]
 
+MIDDLEWARE = [
+    'main.middleware.TimingMiddleware',
+] + MIDDLEWARE + [
+    'main.middleware.CacheBatchMiddleware',
+    'main.middleware.ReplicaMiddleware',
+]
+
 ROOT_URLCONF = PROJECT + '.urls.urls'
 
 ROOT_ROUTERCONF = PROJECT + '.urls.router'
 
 WSGI_APPLICATION = PROJECT + '.wsgi.application'
 
+# Identifies the running release; keys deploy-scoped caches and ETags.
+DEPLOY_VERSION = os.environ.get(
+    'DEPLOY_VERSION', os.environ.get('HEROKU_SLUG_COMMIT', '')
+)
+
 
 # Database
 
+# Connections are kept open for DB_CONN_MAX_AGE seconds, per process and
+# per worker thread. Set DB_POOLER when connecting through a pooler such
+# as pgbouncer in transaction mode.
 DATABASES = {
-    'default': dj_database_url.config(default='postgres://postgres@db/postgres'),
+    'default': dj_database_url.config(
+        default='postgres://postgres@db/postgres',
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 60))
+    ),
 }
 
+DB_POOLER = os.environ.get('DB_POOLER', '')
+
+# Django 1.10 never uses server-side cursors, so this has no effect yet.
+# It is set ahead of the upgrade to 1.11, whose `QuerySet.iterator()`
+# opens them, which breaks under transaction pooling.
+if DB_POOLER:
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+DB_HEALTH_CHECKS = os.environ.get('DB_HEALTH_CHECKS', 'false').lower() == 'true'
+
+# Read replicas, as a comma separated list of URLs. Safe requests read
+# from them via `main.middleware.ReplicaMiddleware`.
+DATABASE_REPLICA_URLS = [
+    u for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u
+]
+
+for index, url in enumerate(DATABASE_REPLICA_URLS):
+    DATABASES['replica%d' % index] = dj_database_url.parse(
+        url, conn_max_age=DATABASES['default']['CONN_MAX_AGE']
+    )
+    DATABASES['replica%d' % index]['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['main.db.ReplicaRouter']
+
+REPLICA_STICKY_SECONDS = 5
+
 
 # Internationalization
 
@@ -73,6 +117,7 @@ WEBPACK_LOADER = {
         'BUNDLE_DIR_NAME': '',
         'STATS_FILE': os.path.join(VAR_DIR, 'build', 'webpack-stats.json'),
         'CACHE': False,
+        'LOADER_CLASS': 'main.webpack.CachedWebpackLoader',
     }
 }
 
@@ -85,20 +130,45 @@ LOGIN_REDIRECT_URL = '/'
 
 XAUTH_AJAX = True
 
+# Sessions and users are read from the cache; session writes go through
+# to the database.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Sessions created before the cached backend was added still name the
+# plain model backend, so keep it available.
+AUTHENTICATION_BACKENDS = [
+    'main.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+USER_CACHE_TIMEOUT = 300
+
+
+# Metrics
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Opt-in sampling profiler (see `main.profiler`).
+PROFILER_ENABLED = os.environ.get('PROFILER', 'false').lower() == 'true'
+
+PROFILER_INTERVAL = 0.01
+
+PROFILER_MAX_SECONDS = 300
+
 
 # Django Rest Framework
 
 REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
     'EXCEPTION_HANDLER': 'rest_framework_json_api.exceptions.exception_handler',
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework_json_api.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'main.pagination.CursorPagination',
     'DEFAULT_PARSER_CLASSES': (
-        'rest_framework_json_api.parsers.JSONParser',
+        'main.parsers.JSONParser',
         'rest_framework.parsers.FormParser',
         'rest_framework.parsers.MultiPartParser'
     ),
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework_json_api.renderers.JSONRenderer',
+        'main.renderers.JSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ),
     'DEFAULT_METADATA_CLASS': 'rest_framework_json_api.metadata.JSONAPIMetadata',
@@ -116,16 +186,40 @@ REST_FRAMEWORK = {
 
 REDIS_URL = os.environ.get('REDIS_URL', 'redis://0.0.0.0:6379')
 
+# Process layout, as used by the supervisor configurations.
+WEB_PROCESSES = int(os.environ.get('WEB_PROCESSES', 1))
+
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 1))
+
+WORKER_THREADS = int(os.environ.get('WORKER_THREADS', 0))
+
+# Connections are pooled per process and shared by the cache and the
+# channel layers (see `main.pool.SharedPoolMixin`). Each worker thread,
+# the main thread included, holds at most one at a time: either while
+# it blocks receiving from a channel layer (a BLPOP of up to five
+# seconds) or for each cache or channel command of the consumer it
+# runs. On top of those, the process' one cache invalidation listener
+# holds a connection for good (see `main.cache.LocalTier`), and one more
+# is headroom for the odd connection used outside the worker threads.
+# Pool waits and timeouts are exported on /metrics as `redis_pool_*`.
+REDIS_MAX_CONNECTIONS = int(os.environ.get(
+    'REDIS_MAX_CONNECTIONS', WEB_THREADS + WORKER_THREADS + 2
+))
+
+REDIS_POOL_TIMEOUT = int(os.environ.get('REDIS_POOL_TIMEOUT', 5))
+
 CACHES = {
     'default': {
-        'BACKEND': 'django_redis.cache.RedisCache',
+        'BACKEND': 'main.cache.TwoTierRedisCache',
         'LOCATION': REDIS_URL,
         'OPTIONS': {
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
-            'CONNECTION_POOL_CLASS': 'redis.connection.BlockingConnectionPool',
+            'CONNECTION_POOL_CLASS': 'main.pool.MeteredBlockingConnectionPool',
             'CONNECTION_POOL_KWARGS': {
-                'max_connections': 7,
-                'timeout': 5
+                'max_connections': REDIS_MAX_CONNECTIONS,
+                'timeout': REDIS_POOL_TIMEOUT,
             }
         }
     }
@@ -143,30 +237,84 @@ AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY', '')
 
 # Channels/CQ
 
+# Task queue lanes. Tasks cq submits itself land on `default`; queue
+# others with `main.lanes.delay` to prioritise. Workers receiving from
+# several lanes pick between them in proportion to `weight`.
+CQ_LANES = {
+    'high': {'channel': 'cq-tasks.high', 'capacity': 500, 'weight': 6},
+    'default': {'channel': 'cq-tasks', 'capacity': 1000, 'weight': 3},
+    'bulk': {'channel': 'cq-tasks.bulk', 'capacity': 5000, 'weight': 1},
+}
+
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'redis_channel_layer.DjangoRedisChannelLayer',
+        'BACKEND': 'main.pool.SharedPoolChannelLayer',
         'CONFIG': {
             'hosts': [REDIS_URL],
         },
         'ROUTING': PROJECT + '.urls.channels.channel_routing'
     },
     'long': {
-        'BACKEND': 'redis_channel_layer.DjangoRedisChannelLayer',
+        'BACKEND': 'main.lanes.LanedChannelLayer',
         'CONFIG': {
             'hosts': [REDIS_URL],
             'expiry': 1800,
-            'channel_capacity': {
-                'cq-tasks': 1000
-            }
+            'lanes': CQ_LANES,
         },
-        'ROUTING': PROJECT + '.urls.channels.channel_routing',
+        'ROUTING': PROJECT + '.urls.channels.lane_routing',
     },
 }
 
 CQ_CHANNEL_LAYER = 'long'
 
 
+# Admission control for daphne (see `main.admission`). Limits apply per
+# daphne process; priority requests get `PRIORITY_FACTOR` times the
+# in-flight limit.
+
+ADMISSION = {
+    'ENABLED': os.environ.get('ADMISSION', 'true').lower() == 'true',
+    'MAX_IN_FLIGHT': int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', 100)),
+    'MAX_FILL': 0.8,
+    'PRIORITY_MAX_FILL': 0.95,
+    'PRIORITY_FACTOR': 2,
+    'RETRY_AFTER': 5,
+    'EXEMPT_PATHS': ['/health/'],
+    'PRIORITY_PATHS': ['/api/'],
+    'TIMEOUT': 120,
+}
+
+
+# Autoscaling (see `manage.py autoscale`). Each group scales between its
+# `min` and the `numprocs` supervisor starts it with.
+
+AUTOSCALE = {
+    'ENABLED': os.environ.get('AUTOSCALE', 'false').lower() == 'true',
+    'SUPERVISOR_URL': 'http://127.0.0.1:9001/RPC2',
+    'INTERVAL': 10,
+    'COOLDOWN': 6,
+    'SCALE_DOWN_BELOW': 0.5,
+    'CPU_TARGET': 70,
+    'LATENCY_TARGET': 0.5,
+    'PROBE_URL': os.environ.get('AUTOSCALE_PROBE_URL', ''),
+    'BACKLOG_TARGET': 20,
+    'BACKLOG_CHANNELS': {
+        'default': ['http.request'],
+        'long': [lane['channel'] for lane in CQ_LANES.values()],
+    },
+    'GROUPS': {
+        'daphne': {
+            'min': int(os.environ.get('WEB_PROCESSES_MIN', 1)),
+            'signals': ['cpu', 'latency'],
+        },
+        'channelsworker': {
+            'min': int(os.environ.get('WORKER_PROCESSES_MIN', 1)),
+            'signals': ['cpu', 'backlog'],
+        },
+    },
+}
+
+
 # Loggers
 
 LOGGING = {
@@ -180,6 +328,15 @@ LOGGING = {
         'verbose': {
             'format': '%(levelname)s %(asctime)s %(module)s %(message)s'
         },
+        'json': {
+            '()': 'main.log.JSONFormatter',
+        },
+    },
+    'filters': {
+        'sample': {
+            '()': 'main.log.SamplingFilter',
+            'rate': float(os.environ.get('LOG_SAMPLE_RATE', 1.0)),
+        },
     },
     'handlers': {
         'console': {
@@ -187,6 +344,11 @@ LOGGING = {
             'class': 'logging.StreamHandler',
             'formatter': 'verbose'
         },
+        'async': {
+            'level': 'DEBUG',
+            'class': 'main.log.AsyncStreamHandler',
+            'formatter': 'json',
+        },
         'null': {
             'level': 'INFO',
             'class': 'logging.NullHandler',
@@ -198,6 +360,9 @@ LOGGING = {
             'filters': [],
             'propagate': True,
             'level': 'INFO',
-        }
+        },
+        'main.middleware': {
+            'filters': ['sample'],
+        },
     }
 }
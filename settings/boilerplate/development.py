@@ -35,13 +35,24 @@ TEST_RUNNER = 'supertest.runner.SuperTestRunner'
 
 # Loggers
 
+# Write logs from a background thread, readable rather than as JSON.
+LOGGING['handlers']['async']['formatter'] = 'verbose'
+
 LOGGING['root']['level'] = 'DEBUG'
 
+LOGGING['root']['handlers'] = ['async']
+
 LOGGING['loggers'] = {
     'django.request': {
-        'handlers': ['console'],
+        'handlers': ['async'],
         'level': 'DEBUG',
-    }
+    },
+    'django.db.backends': {
+        'filters': ['sample'],
+    },
+    'main.middleware': {
+        'filters': ['sample'],
+    },
 }
 
 
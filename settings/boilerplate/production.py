@@ -31,6 +31,7 @@ WEBPACK_LOADER = {
         'BUNDLE_DIR_NAME': '',
         'STATS_FILE': os.path.join(os.path.dirname(BASE_DIR), 'webpack-stats.production.json'),
         'CACHE': True,
+        'LOADER_CLASS': 'main.webpack.CachedWebpackLoader',
     }
 }
 
@@ -45,7 +46,15 @@ MEDIA_URL = 'https://%s/'%AWS_S3_CUSTOM_DOMAIN
 
 DEFAULT_FILE_STORAGE = 'storages.backends.s3boto.S3BotoStorage'
 
-STATICFILES_STORAGE = 'storages.backends.s3boto.S3BotoStorage'
+# Hashed names with precompressed copies, cached for a year.
+STATICFILES_STORAGE = 'main.storage.S3ManifestStorage'
+
+# Alternatively, keep static files on disk for nginx to serve.
+if os.environ.get('STATIC_LOCAL', 'false').lower() == 'true':
+
+    STATIC_URL = '/static/'
+
+    STATICFILES_STORAGE = 'main.storage.CompressedManifestStorage'
 
 
 # Password validation
@@ -69,13 +78,20 @@ AUTH_PASSWORD_VALIDATORS = [
 
 # Logging
 
+LOGGING['root']['handlers'] = ['async']
+
+LOGGING['loggers']['django']['handlers'] = ['async']
+
 if os.environ.get('DEBUG', 'false').lower() == 'true':
 
     LOGGING['root']['level'] = 'DEBUG'
 
     LOGGING['loggers'] = {
         'django.request': {
-            'handlers': ['console'],
+            'handlers': ['async'],
             'level': 'DEBUG',
-        }
+        },
+        'main.middleware': {
+            'filters': ['sample'],
+        },
     }
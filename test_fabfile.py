@@ -0,0 +1,331 @@
+""" Tests for the fabfile's config resolution, transfers and AWS setup.
+
+Run with `python -m unittest test_fabfile`. AWS is stood in for by moto
+and downloads are served from a local HTTP server.
+"""
+import hashlib
+import http.server
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import boto3
+from moto import mock_rds, mock_s3
+
+import fabfile
+
+
+BUCKET = 'fabfile-test'
+
+PART_SIZE = 5 * 1024 * 1024
+
+
+class MergeCfgsTestCase(unittest.TestCase):
+
+    def test_substitutes_in_dependency_order(self):
+        cfg = fabfile.merge_cfgs({'a': '$b-1', 'b': '${c}2', 'c': 'z'})
+        self.assertEqual(cfg, {'a': 'z2-1', 'b': 'z2', 'c': 'z'})
+
+    def test_later_configs_override(self):
+        cfg = fabfile.merge_cfgs({'a': '$b', 'b': 'x'}, {'b': 'y'})
+        self.assertEqual(cfg['a'], 'y')
+
+    def test_unknown_names_left_alone(self):
+        cfg = fabfile.merge_cfgs({'a': '$missing/x ${other} $b', 'b': 'y'})
+        self.assertEqual(cfg['a'], '$missing/x ${other} y')
+
+    def test_dollars_collapse(self):
+        self.assertEqual(fabfile.merge_cfgs({'a': 'x$$y'})['a'], 'x$y')
+
+    def test_collapsed_dollars_expanded(self):
+        cfg = fabfile.merge_cfgs({'a': '$$b', 'b': 'c'})
+        self.assertEqual(cfg['a'], 'c')
+
+    def test_cycle(self):
+        with self.assertRaises(fabfile.ConfigCycleError) as cm:
+            fabfile.merge_cfgs({'a': '$b', 'b': 'x$c', 'c': '$a'})
+        self.assertIn('a -> b -> c -> a', str(cm.exception))
+
+    def test_self_reference(self):
+        with self.assertRaises(fabfile.ConfigCycleError):
+            fabfile.merge_cfgs({'a': 'x$a'})
+
+    def test_memoized(self):
+        fabfile._resolve_cfg.cache_clear()
+        first = fabfile.merge_cfgs({'a': '$b', 'b': 'x'})
+        first['a'] = 'changed'
+        second = fabfile.merge_cfgs({'b': 'x'}, {'a': '$b'})
+        self.assertEqual(second, {'a': 'x', 'b': 'x'})
+        info = fabfile._resolve_cfg.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+
+    def test_dev_cfg(self):
+        cfg = fabfile.dev_cfg({'project': 'demo'})
+        self.assertEqual(cfg['docker_project'], 'demo_dev')
+        self.assertEqual(cfg['app'], 'demo')
+        self.assertEqual(
+            cfg['compose'],
+            'docker-compose -f boilerplate/docker/docker-compose.develop.yml'
+            ' -f docker/docker-compose.develop.yml -p demo_dev'
+        )
+
+
+class AWSTestCase(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {
+            'AWS_ACCESS_KEY_ID': 'key',
+            'AWS_SECRET_ACCESS_KEY': 'secret',
+            'AWS_DEFAULT_REGION': 'us-east-1',
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for patcher in (mock.patch.object(fabfile, '_aws_session', None),
+                        mock.patch.dict(fabfile._aws_clients, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class EnableDBBackupsTestCase(AWSTestCase):
+
+    def setUp(self):
+        super().setUp()
+        mock_rds_ = mock_rds()
+        mock_rds_.start()
+        self.addCleanup(mock_rds_.stop)
+        for patcher in (mock.patch.dict(fabfile.BASE_CONFIG, {'project': 'demo'}),
+                        mock.patch.object(fabfile.time, 'sleep')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.rds = fabfile.aws_client('rds')
+
+    def create_db(self, retention):
+        self.rds.create_db_instance(
+            DBInstanceIdentifier='demo', DBInstanceClass='db.t2.micro',
+            Engine='postgres', AllocatedStorage=5, MasterUsername='demo',
+            MasterUserPassword='password', BackupRetentionPeriod=retention
+        )
+
+    def get_retention(self):
+        res = self.rds.describe_db_instances(DBInstanceIdentifier='demo')
+        return res['DBInstances'][0]['BackupRetentionPeriod']
+
+    def modify_db(self, cmd, **kwargs):
+        # Stands in for the AWS CLI.
+        self.rds.modify_db_instance(
+            DBInstanceIdentifier='demo', BackupRetentionPeriod=1,
+            ApplyImmediately=True
+        )
+
+    def test_enables_backups(self):
+        self.create_db(0)
+        with mock.patch.object(fabfile, 'run_cfg', side_effect=self.modify_db) as run_cfg:
+            fabfile.aws_enable_db_backups()
+        self.assertIn('--backup-retention-period 1', run_cfg.call_args[0][0])
+        self.assertEqual(self.get_retention(), 1)
+
+    def test_backups_already_enabled(self):
+        self.create_db(7)
+        with mock.patch.object(fabfile, 'run_cfg') as run_cfg:
+            fabfile.aws_enable_db_backups()
+        run_cfg.assert_not_called()
+        self.assertEqual(self.get_retention(), 7)
+
+
+class S3TestCase(AWSTestCase):
+
+    def setUp(self):
+        super().setUp()
+        mock_s3_ = mock_s3()
+        mock_s3_.start()
+        self.addCleanup(mock_s3_.stop)
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.s3.create_bucket(Bucket=BUCKET)
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        quiet = mock.patch.object(fabfile.Progress, 'show')
+        quiet.start()
+        self.addCleanup(quiet.stop)
+
+    def make_file(self, size):
+        path = os.path.join(self.dir, 'data')
+        data = os.urandom(size)
+        with open(path, 'wb') as file:
+            file.write(data)
+        return path, data
+
+    def get_object(self, key):
+        return self.s3.get_object(Bucket=BUCKET, Key=key)['Body'].read()
+
+
+class UploadS3TestCase(S3TestCase):
+
+    def test_upload(self):
+        path, data = self.make_file(PART_SIZE * 2 + 100)
+        fabfile.upload_s3(path, BUCKET, 'data', part_size=PART_SIZE)
+        self.assertEqual(self.get_object('data'), data)
+        self.assertFalse(os.path.exists(path + '.upload'))
+
+    def test_resume_keeps_uploaded_parts(self):
+        path, data = self.make_file(PART_SIZE * 2 + 100)
+        upload_part = self.s3.upload_part
+
+        def fail_on_second_part(**kwargs):
+            if kwargs['PartNumber'] == 2:
+                raise IOError('Connection reset')
+            return upload_part(**kwargs)
+
+        with mock.patch.object(fabfile, 's3_client', return_value=self.s3), \
+                mock.patch.object(self.s3, 'upload_part', fail_on_second_part), \
+                mock.patch.object(fabfile.time, 'sleep'):
+            with self.assertRaises(IOError):
+                fabfile.upload_s3(path, BUCKET, 'data', part_size=PART_SIZE,
+                                  concurrency=1)
+        self.assertTrue(os.path.exists(path + '.upload'))
+
+        calls = []
+
+        def record_part(**kwargs):
+            calls.append(kwargs['PartNumber'])
+            return upload_part(**kwargs)
+
+        with mock.patch.object(fabfile, 's3_client', return_value=self.s3), \
+                mock.patch.object(self.s3, 'upload_part', record_part):
+            fabfile.upload_s3(path, BUCKET, 'data', part_size=PART_SIZE,
+                              concurrency=1)
+        self.assertEqual(calls, [2])
+        self.assertEqual(self.get_object('data'), data)
+
+    def test_resume_after_upload_aborted(self):
+        path, data = self.make_file(PART_SIZE + 100)
+        upload_id = self.s3.create_multipart_upload(
+            Bucket=BUCKET, Key='data'
+        )['UploadId']
+        with open(path + '.upload', 'w') as file:
+            fabfile.json.dump({
+                'key': [BUCKET, 'data', len(data), PART_SIZE],
+                'upload_id': upload_id,
+            }, file)
+        self.s3.abort_multipart_upload(
+            Bucket=BUCKET, Key='data', UploadId=upload_id
+        )
+        fabfile.upload_s3(path, BUCKET, 'data', part_size=PART_SIZE)
+        self.assertEqual(self.get_object('data'), data)
+
+
+class StreamS3TestCase(S3TestCase):
+
+    def test_stream(self):
+        data = os.urandom(PART_SIZE + 100)
+        fabfile.stream_s3(io.BytesIO(data), BUCKET, 'data', part_size=PART_SIZE)
+        self.assertEqual(self.get_object('data'), data)
+
+    def test_failed_check_aborts(self):
+        def check():
+            raise RuntimeError('pg_dump failed')
+
+        with self.assertRaises(RuntimeError):
+            fabfile.stream_s3(io.BytesIO(b'partial'), BUCKET, 'data',
+                              part_size=PART_SIZE, check=check)
+        uploads = self.s3.list_multipart_uploads(Bucket=BUCKET)
+        self.assertEqual(uploads.get('Uploads', []), [])
+        with self.assertRaises(self.s3.exceptions.NoSuchKey):
+            self.s3.get_object(Bucket=BUCKET, Key='data')
+
+
+class FileHandler(http.server.BaseHTTPRequestHandler):
+    data = b''
+    etag = None
+    ranges = True
+
+    def do_GET(self):
+        etag = '"{}"'.format(self.etag or hashlib.md5(self.data).hexdigest())
+        header = self.headers.get('Range')
+        if header and self.ranges:
+            start, end = map(int, header.split('=')[1].split('-'))
+            body = self.data[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, end, len(self.data)
+            ))
+        else:
+            body = self.data
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadURLTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        quiet = mock.patch.object(fabfile.Progress, 'show')
+        quiet.start()
+        self.addCleanup(quiet.stop)
+
+    def serve(self, data, ranges=True, etag=None):
+        handler = type('Handler', (FileHandler,), {
+            'data': data, 'ranges': ranges, 'etag': etag,
+        })
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+        return 'http://127.0.0.1:{}/data'.format(server.server_address[1])
+
+    def test_ranged(self):
+        data = os.urandom(1000)
+        dst = os.path.join(self.dir, 'data')
+        fabfile.download_url(self.serve(data), dst, part_size=300)
+        with open(dst, 'rb') as file:
+            self.assertEqual(file.read(), data)
+        self.assertFalse(os.path.exists(dst + '.download'))
+
+    def test_resume(self):
+        data = os.urandom(1000)
+        dst = os.path.join(self.dir, 'data')
+        with open(dst, 'wb') as file:
+            file.write(data[:300] + b'\0' * 700)
+        with open(dst + '.download', 'w') as file:
+            fabfile.json.dump({
+                'etag': hashlib.md5(data).hexdigest(), 'size': 1000, 'done': [0],
+            }, file)
+        url = self.serve(data)
+        with mock.patch.object(fabfile.urllib.request, 'urlopen',
+                               wraps=fabfile.urllib.request.urlopen) as urlopen:
+            fabfile.download_url(url, dst, part_size=300)
+        ranges = sorted(c[0][0].headers['Range'] for c in urlopen.call_args_list)
+        self.assertEqual(ranges, [
+            'bytes=0-0', 'bytes=300-599', 'bytes=600-899', 'bytes=900-999',
+        ])
+        with open(dst, 'rb') as file:
+            self.assertEqual(file.read(), data)
+
+    def test_range_ignored(self):
+        data = os.urandom(1000)
+        dst = os.path.join(self.dir, 'data')
+        fabfile.download_url(self.serve(data, ranges=False), dst, part_size=300)
+        with open(dst, 'rb') as file:
+            self.assertEqual(file.read(), data)
+
+    def test_verification_failure(self):
+        data = os.urandom(1000)
+        dst = os.path.join(self.dir, 'data')
+        url = self.serve(data, etag=hashlib.md5(b'other').hexdigest())
+        with self.assertRaises(SystemExit):
+            fabfile.download_url(url, dst, part_size=300)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,12 @@
+from django.conf import settings
 from channels.routing import route, include
+from cq.routing import channel_routing as cq_routing
+from main.lanes import lane_routes
 
 channel_routing = [
     include('cq.routing.channel_routing')
 ]
+
+# The task queue layer routes only its lanes, so workers on it receive
+# nothing else and can weigh the lanes against each other.
+lane_routing = lane_routes(cq_routing, 'cq-tasks', settings.CQ_LANES)